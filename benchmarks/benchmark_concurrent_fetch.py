@@ -0,0 +1,77 @@
+"""Compares sequential and concurrent history downloads in export_data against the fake wandb backend.
+Every history request sleeps for a fixed latency, and a fraction of the runs time out once
+to exercise the retry logic.
+
+Usage: python benchmarks/benchmark_concurrent_fetch.py [--runs 200] [--latency 0.05]
+"""
+import argparse
+import os
+import random
+import requests
+import sys
+import time
+
+from unittest import mock
+
+import numpy as np
+
+# import wandb2numpy from this checkout, also if the package is not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_wandb import FakeApi, patch_wandb
+from wandb2numpy import export_data
+
+
+def fail_once(run):
+    history = run.history
+
+    def flaky_history(*args, **kwargs):
+        if not getattr(run, "failed", False):
+            run.failed = True
+            raise requests.exceptions.Timeout("injected timeout")
+        return history(*args, **kwargs)
+
+    run.history = flaky_history
+
+
+def run_export(n_runs, n_steps, latency, n_workers, fail_fraction):
+    api = FakeApi.synthetic(n_runs=n_runs, n_steps=n_steps, n_fields=2, latency=latency)
+    rng = random.Random(0)
+    for run in api._runs:
+        if rng.random() < fail_fraction:
+            fail_once(run)
+    fields = api._runs[0].fields
+    config = {"bench": {"entity": "fake_entity", "project": "fake_project", "fields": fields, "history_samples": n_steps,
+                        "n_workers": n_workers, "max_retries": 2, "retry_backoff": 0.01}}
+
+    with patch_wandb(api), mock.patch("builtins.print"):
+        start = time.perf_counter()
+        data_dict, _ = export_data(config)
+        elapsed = time.perf_counter() - start
+
+    # deterministic ordering: row i must belong to run i
+    matrix = data_dict["bench"][fields[0]]
+    assert matrix.shape == (n_runs, n_steps)
+    for i, run in enumerate(api._runs):
+        assert np.array_equal(matrix[i], [row[fields[0]] for row in run._rows(fields, range(n_steps))])
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent history downloads")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--fail-fraction", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16, 32])
+    args = parser.parse_args()
+
+    baseline = None
+    for n_workers in args.workers:
+        elapsed = run_export(args.runs, args.steps, args.latency, n_workers, args.fail_fraction)
+        baseline = baseline or elapsed
+        print(f"n_workers={n_workers:3d}: {elapsed:7.2f}s (speedup {baseline / elapsed:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
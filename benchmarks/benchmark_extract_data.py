@@ -0,0 +1,72 @@
+"""Microbenchmark of the conversion of a run history into per-field arrays in util.extract_data.
+Compares the columnar single-pass conversion (util.history_to_arrays) with the previous
+per-field loop over all data points.
+
+Usage: python benchmarks/benchmark_extract_data.py [--steps 200000] [--fields 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# import wandb2numpy from this checkout, also if the package is not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wandb2numpy import util
+
+
+def legacy_history_to_arrays(history, fields):
+    # per-field loop that was used in util.extract_data before the columnar conversion
+    data_dict = {}
+    for key in fields:
+        data_list = []
+        is_valid_key = True
+        for data_point in history:
+            if not key in data_point.keys():
+                is_valid_key = False
+                break
+            if is_valid_key:
+                data_list.append(data_point[key])
+        data_dict[key] = np.array(data_list)
+    return data_dict
+
+
+def make_history(n_steps, n_fields):
+    rng = np.random.default_rng(0)
+    values = rng.standard_normal((n_steps, n_fields)).tolist()
+    fields = [f"field_{i}" for i in range(n_fields)]
+    return [{"_step": s, **dict(zip(fields, row))} for s, row in enumerate(values)], fields
+
+
+def time_fn(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark history to array conversion")
+    parser.add_argument("--steps", type=int, nargs="+", default=[10000, 100000, 500000])
+    parser.add_argument("--fields", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    for n_steps in args.steps:
+        history, fields = make_history(n_steps, args.fields)
+        t_legacy, legacy = time_fn(lambda: legacy_history_to_arrays(history, fields), args.repeats)
+        t_columnar, columnar = time_fn(lambda: util.history_to_arrays(history, fields), args.repeats)
+        for key in fields:
+            assert np.array_equal(legacy[key], columnar[key])
+        # iterators (as returned by run.scan_history) are consumed once, in chunks
+        t_iter, _ = time_fn(lambda: util.history_to_arrays(iter(history), fields), args.repeats)
+        print(f"steps={n_steps:8d} fields={args.fields}: legacy {t_legacy:7.3f}s, columnar {t_columnar:7.3f}s "
+              f"(speedup {t_legacy / t_columnar:4.1f}x), columnar from iterator {t_iter:7.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Measures the startup time of wandb2numpy in fresh interpreters: importing the package, the command line --help,
+a --dry-run of an example config and loading the readers of exported files. Also checks that these paths do not import
+the heavy dependencies (wandb, pandas) and exits with an error if a command is slower than --max-seconds.
+
+Usage: python benchmarks/benchmark_startup.py [--repeats 5] [--max-seconds 1.0]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE_CONFIG = os.path.join(ROOT, "example_configs", "example_config_1.yaml")
+
+# check run after each command, printing the heavy modules that were imported
+CHECK_MODULES = "import sys; print('imported:' + ','.join(m for m in ('wandb', 'pandas') if m in sys.modules))"
+
+COMMANDS = {
+    "import": "import wandb2numpy",
+    "help": "from wandb2numpy import command_line\ntry:\n    command_line.main(['--help'])\nexcept SystemExit:\n    pass",
+    "dry_run": f"from wandb2numpy import command_line\ncommand_line.main([{EXAMPLE_CONFIG!r}, '--dry-run'])",
+    "load_ragged": "import wandb2numpy\nwandb2numpy.load_ragged",
+}
+
+
+def time_command(code: str, repeats: int):
+    """Returns the best wall time of running code in a fresh interpreter and the heavy modules it imported"""
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    best, imported = float("inf"), ""
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", f"{code}\n{CHECK_MODULES}"], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        best = min(best, time.perf_counter() - start)
+        imported = output.splitlines()[-1][len("imported:"):]
+    return best, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of wandb2numpy")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=1.0, help="fail if a command takes longer")
+    args = parser.parse_args()
+
+    baseline, _ = time_command("pass", args.repeats)
+    print(f"{'python interpreter':<20}{baseline:8.3f}s")
+    failed = []
+    for name, code in COMMANDS.items():
+        seconds, imported = time_command(code, args.repeats)
+        line = f"{name:<20}{seconds:8.3f}s"
+        if imported:
+            line += f"  imports {imported}"
+            failed.append(name)
+        if seconds > args.max_seconds:
+            line += f"  slower than {args.max_seconds}s"
+            failed.append(name)
+        print(line)
+
+    if failed:
+        sys.exit(f"Startup benchmark failed for: {', '.join(sorted(set(failed)))}")
+
+
+if __name__ == "__main__":
+    main()
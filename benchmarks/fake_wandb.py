@@ -0,0 +1,137 @@
+"""Local stand-in for wandb.Api and wandb runs, generating synthetic runs of configurable count, length,
+number of fields and request latency. Used by the benchmarks, so they can run without network access.
+
+Example:
+    api = FakeApi.synthetic(n_runs=100, n_steps=10000, n_fields=10, latency=0.01)
+    with patch_wandb(api):
+        data_dict, config_list = wandb2numpy.export_data(config)
+"""
+import threading
+import time
+
+from contextlib import contextmanager
+from unittest import mock
+
+import numpy as np
+
+from wandb2numpy.filtering import match_filters
+
+
+class FakeRun:
+    """Run whose history logs each field every frequencies[field] steps (every step by default).
+    Fields in summary_only are only written to the summary, like metrics set with run.summary[...].
+    As in wandb, scan_history(keys=...) only returns the rows that contain all requested keys."""
+
+    def __init__(self, idx, n_steps, fields, group="group_0", job_type="job_0", state="finished",
+                 latency=0.0, page_latency=0.0, seed=0, frequencies=None, summary_only=()):
+        self.id = f"fake{idx:05d}"
+        self.name = f"run_{idx:05d}"
+        self.entity = "fake_entity"
+        self.project = "fake_project"
+        self.group = group
+        self.job_type = job_type
+        self.state = state
+        self.tags = []
+        self.config = {"seed": seed, "lr": 10.0 ** -(seed % 4)}
+        self.n_steps = n_steps
+        self.lastHistoryStep = n_steps - 1
+        self.fields = list(fields)
+        self.latency = latency
+        self.page_latency = page_latency
+        self.seed = seed
+        self.n_requests = 0
+        self.lock = threading.Lock()
+        self.frequencies = dict(frequencies or {})
+        self.summary_metrics = {field: 0.0 for field in self.fields + list(summary_only)}
+        self.summary_metrics.update({"_step": n_steps - 1, "_runtime": 1.0})
+
+    @property
+    def history_keys(self):
+        counts = {field: len(range(0, self.n_steps, self.frequencies.get(field, 1))) for field in self.fields}
+        return {"keys": {field: {"typeCounts": [{"type": "number", "count": count}]} for field, count in counts.items()},
+                "lastStep": self.n_steps - 1}
+
+    @property
+    def summary(self):
+        return self.summary_metrics
+
+    def _request(self, latency):
+        with self.lock:
+            self.n_requests += 1
+        if latency > 0:
+            time.sleep(latency)
+
+    def _rows(self, keys, steps):
+        fields = [k for k in (keys or self.fields) if k in self.fields]
+        # values only depend on the step, so that partial downloads (e.g. from min_step) match a full download
+        columns = np.array([self.fields.index(k) for k in fields], dtype=np.float64)
+        values = np.sin(np.asarray(steps, dtype=np.float64)[:, None] * 0.37 + columns[None, :] * 1.3 + self.seed).tolist()
+        rows = []
+        for step, row in zip(steps, values):
+            logged = {k: v for k, v in zip(fields, row) if step % self.frequencies.get(k, 1) == 0}
+            if logged or not fields:
+                rows.append({"_step": int(step), **logged})
+        return rows
+
+    def history(self, samples=500, keys=None, x_axis="_step", pandas=True, **kwargs):
+        self._request(self.latency)
+        steps = np.unique(np.linspace(0, self.n_steps - 1, min(samples, self.n_steps)).astype(int)) if self.n_steps else []
+        return self._rows(keys, steps)
+
+    def scan_history(self, keys=None, page_size=1000, min_step=0, max_step=None):
+        stop = self.n_steps if max_step is None else min(max_step, self.n_steps)
+        for start in range(min_step or 0, stop, page_size):
+            self._request(self.page_latency or self.latency)
+            for row in self._rows(keys, range(start, min(start + page_size, stop))):
+                if keys is None or all(k in row for k in keys):
+                    yield row
+
+
+class FakeApi:
+    def __init__(self, runs, latency=0.0):
+        self._runs = runs
+        self.latency = latency
+        self.n_requests = 0
+
+    @classmethod
+    def synthetic(cls, n_runs=10, n_steps=1000, n_fields=5, n_groups=1, latency=0.0, page_latency=0.0,
+                  step_jitter=0.0, seed=0, frequencies=None, summary_only=()):
+        """Creates runs with n_fields fields each, evenly distributed over n_groups groups.
+        With step_jitter > 0, the number of steps of each run varies randomly by up to that fraction.
+        frequencies and summary_only are passed to every FakeRun."""
+        rng = np.random.default_rng(seed)
+        fields = [f"metric_{i}" for i in range(n_fields)]
+        runs = []
+        for i in range(n_runs):
+            steps = int(n_steps * (1 - step_jitter * rng.random()))
+            runs.append(FakeRun(i, steps, fields, group=f"group_{i % n_groups}", latency=latency,
+                                page_latency=page_latency, seed=seed + i, frequencies=frequencies, summary_only=summary_only))
+        return cls(runs, latency)
+
+    @property
+    def total_requests(self):
+        return self.n_requests + sum(run.n_requests for run in self._runs)
+
+    def runs(self, path=None, filters=None, order="+created_at", per_page=50, **kwargs):
+        entity, project = path.split("/")
+        matches = [run for run in self._runs if run.entity == entity and run.project == project and match_filters(run, filters or {})]
+        # one request per page of runs
+        for _ in range(max(1, -(-len(matches) // per_page))):
+            self.n_requests += 1
+            if self.latency > 0:
+                time.sleep(self.latency)
+        return matches
+
+    def run(self, path):
+        self.n_requests += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        entity, project, run_id = path.split("/")
+        return next(run for run in self._runs if run.entity == entity and run.project == project and run.id == run_id)
+
+
+@contextmanager
+def patch_wandb(api: FakeApi):
+    """Makes wandb.Api() return the given FakeApi"""
+    with mock.patch("wandb.Api", return_value=api):
+        yield api
@@ -0,0 +1,161 @@
+"""Benchmark suite for the export pipeline, running against the fake wandb backend in fake_wandb.py.
+Times the startup, get_filtered_runs (per experiment and batched), extract_data, run_dict_to_field_dict, save_matrix and export_data end to end
+across scaling sweeps. Each result is appended to a JSON lines file together with the git revision,
+and compared to the previous result of the same benchmark to make regressions visible.
+
+Usage: python benchmarks/run_benchmarks.py [--quick] [--results benchmarks/results.jsonl] [--threshold 0.2]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# import wandb2numpy from this checkout, also if the package is not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_startup import COMMANDS, time_command
+from fake_wandb import FakeApi, patch_wandb
+from wandb2numpy import export_data, util
+from wandb2numpy.filtering import get_filtered_runs, get_filtered_runs_batched
+from wandb2numpy.save_experiment import save_matrix
+
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+def best_of(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with quiet():
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_get_filtered_runs(n_runs, repeats):
+    api = FakeApi.synthetic(n_runs=n_runs, n_steps=1, n_groups=10)
+    config = {"entity": "fake_entity", "project": "fake_project", "groups": [f"group_{i}" for i in range(5)],
+              "summary": {"metric_0": {"min": -1.0}}}
+    return best_of(lambda: get_filtered_runs(config, api), repeats)
+
+
+def bench_get_filtered_runs_batched(n_runs, n_experiments, repeats):
+    api = FakeApi.synthetic(n_runs=n_runs, n_steps=1, n_groups=n_experiments, latency=0.001)
+    config_list = [{"entity": "fake_entity", "project": "fake_project", "groups": [f"group_{i}"]} for i in range(n_experiments)]
+    return best_of(lambda: get_filtered_runs_batched(config_list, api), repeats)
+
+
+def bench_extract_data(n_steps, n_fields, repeats):
+    run = FakeApi.synthetic(n_runs=1, n_steps=n_steps, n_fields=n_fields)._runs[0]
+    config = {"history_samples": "all"}
+    return best_of(lambda: util.extract_data(run, run.fields, config), repeats)
+
+
+def make_run_dict(n_runs, n_steps, n_fields):
+    rng = np.random.default_rng(0)
+    lengths = (n_steps * (1 - 0.5 * rng.random(n_runs))).astype(int)
+    return {i: {f"metric_{j}": rng.standard_normal(lengths[i]) for j in range(n_fields)} for i in range(n_runs)}
+
+
+def bench_run_dict_to_field_dict(n_runs, n_steps, n_fields, repeats):
+    run_dict = make_run_dict(n_runs, n_steps, n_fields)
+    return best_of(lambda: util.run_dict_to_field_dict(run_dict, {}), repeats)
+
+
+def bench_save_matrix(n_runs, n_steps, repeats):
+    matrix_dict = {"metric_0": np.random.default_rng(0).standard_normal((n_runs, n_steps))}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        return best_of(lambda: save_matrix(matrix_dict, tmp_dir, "metric_0", True, {}), repeats)
+
+
+def bench_export_data(n_runs, n_steps, latency, n_workers, repeats):
+    api = FakeApi.synthetic(n_runs=n_runs, n_steps=n_steps, n_fields=5, latency=latency, step_jitter=0.2)
+    config = {"bench": {"entity": "fake_entity", "project": "fake_project", "fields": "all",
+                        "history_samples": "all", "n_workers": n_workers}}
+    with patch_wandb(api):
+        return best_of(lambda: export_data(config), repeats)
+
+
+def bench_startup(command, repeats):
+    return time_command(COMMANDS[command], repeats)[0]
+
+
+def get_suite(quick):
+    scale = [1, 10] if quick else [1, 10, 100]
+    suite = []
+    for n in scale:
+        suite.append(("get_filtered_runs", {"n_runs": 100 * n}, bench_get_filtered_runs))
+        suite.append(("get_filtered_runs_batched", {"n_runs": 100 * n, "n_experiments": 10}, bench_get_filtered_runs_batched))
+        suite.append(("extract_data", {"n_steps": 1000 * n, "n_fields": 10}, bench_extract_data))
+        suite.append(("run_dict_to_field_dict", {"n_runs": 10 * n, "n_steps": 1000 * n, "n_fields": 5}, bench_run_dict_to_field_dict))
+        suite.append(("save_matrix", {"n_runs": 10 * n, "n_steps": 1000 * n}, bench_save_matrix))
+    for command in ["import", "dry_run"]:
+        suite.append(("startup", {"command": command}, bench_startup))
+    for n_workers in [1, 8]:
+        suite.append(("export_data", {"n_runs": 20 * scale[-1] // 10, "n_steps": 2000, "latency": 0.01, "n_workers": n_workers}, bench_export_data))
+    return suite
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous_results(results_path):
+    previous = {}
+    if os.path.isfile(results_path):
+        with open(results_path, "r") as f:
+            for line in f:
+                result = json.loads(line)
+                previous[(result["benchmark"], json.dumps(result["params"], sort_keys=True))] = result
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the wandb2numpy benchmark suite against a fake wandb backend")
+    parser.add_argument("--quick", action="store_true", help="smaller sweeps")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--results", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl"))
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown reported as regression")
+    args = parser.parse_args()
+
+    previous = load_previous_results(args.results)
+    revision = git_revision()
+    regressions = []
+
+    with open(args.results, "a") as f:
+        for name, params, fn in get_suite(args.quick):
+            seconds = fn(**params, repeats=args.repeats)
+            result = {"benchmark": name, "params": params, "seconds": seconds, "revision": revision, "timestamp": time.time()}
+            f.write(json.dumps(result) + "\n")
+
+            line = f"{name:<24}{json.dumps(params):<70}{seconds:10.4f}s"
+            prev = previous.get((name, json.dumps(params, sort_keys=True)))
+            if prev is not None:
+                change = seconds / prev["seconds"] - 1
+                line += f"  {change:+7.1%} vs {prev['revision']}"
+                if change > args.threshold:
+                    line += "  REGRESSION"
+                    regressions.append(name)
+            print(line)
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than the previous result by more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,28 @@
-from .export import export_data
\ No newline at end of file
+# The public API is imported lazily on first access, so that "import wandb2numpy" does not import wandb and pandas
+# until they are needed (e.g. reading exported files or validating a config does not need wandb).
+_LAZY_ATTRIBUTES = {
+    "export_data": ".export",
+    "ExportPlan": ".plan",
+    "compile_config": ".plan",
+    "Dataset": ".dataset",
+    "ExperimentView": ".dataset",
+    "open_dataset": ".dataset",
+    "RaggedArray": ".ragged",
+    "load_ragged": ".ragged",
+    "load_table": ".backends",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES.keys())
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
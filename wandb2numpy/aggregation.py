@@ -0,0 +1,138 @@
+import re
+import warnings
+import numpy as np
+import pandas as pd
+
+from typing import Dict
+
+
+def get_aggregate_settings(config: dict) -> dict:
+    """Returns the aggregation settings of an experiment config with defaults filled in"""
+    aggregate = config.get("aggregate", {}) or {}
+    if not isinstance(aggregate, dict):
+        aggregate = {}
+    return {
+        "statistics": aggregate.get("statistics", ["mean", "std"]),
+        "window": (aggregate.get("smoothing", {}) or {}).get("window", None),
+        "ema": (aggregate.get("smoothing", {}) or {}).get("ema", None),
+        "downsample": aggregate.get("downsample", 1),
+    }
+
+
+def quantile_of(statistic: str):
+    """Returns the quantile (between 0 and 1) of 'median' and 'q<percent>' statistics (e.g. q25), None otherwise"""
+    if statistic == "median":
+        return 0.5
+    match = re.fullmatch(r"q(\d+(\.\d+)?)", statistic)
+    return float(match.group(1)) / 100 if match else None
+
+
+def preprocess_run(values: np.ndarray, settings: dict) -> np.ndarray:
+    """Applies the optional smoothing (moving average or exponential moving average) and downsampling
+    (mean of blocks of downsample steps) to the values of a single run, ignoring NaNs"""
+    values = values.astype(np.float64)
+    if settings["window"]:
+        values = pd.Series(values).rolling(settings["window"], min_periods=1).mean().to_numpy()
+    elif settings["ema"]:
+        # ema is the weight of the previous average, as in the wandb smoothing slider
+        values = pd.Series(values).ewm(alpha=1 - settings["ema"], ignore_na=True).mean().to_numpy()
+
+    factor = settings["downsample"]
+    if factor > 1 and len(values) > 0:
+        n_blocks = -(-len(values) // factor)
+        padded = np.full(n_blocks * factor, np.nan)
+        padded[:len(values)] = values
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            values = np.nanmean(padded.reshape(n_blocks, factor), axis=1)
+    return values
+
+
+class StreamingAggregator:
+    """NaN-aware statistics over runs per step, updated run by run so that the runs do not have to be kept in memory.
+    Mean and standard deviation use Welford's algorithm. Memory scales with the number of steps,
+    except for median and quantiles, which need the values of all runs.
+    """
+
+    def __init__(self, config: dict):
+        self.settings = get_aggregate_settings(config)
+        self.quantiles = [s for s in self.settings["statistics"] if quantile_of(s) is not None]
+        self.fields = {}
+
+    def _field_state(self, field: str, length: int) -> dict:
+        state = self.fields.setdefault(field, {
+            "count": np.zeros(0), "mean": np.zeros(0), "m2": np.zeros(0),
+            "min": np.zeros(0), "max": np.zeros(0), "runs": [],
+        })
+        current = len(state["count"])
+        if length > current:
+            pad = length - current
+            for key, fill in (("count", 0.0), ("mean", 0.0), ("m2", 0.0), ("min", np.inf), ("max", -np.inf)):
+                state[key] = np.concatenate([state[key], np.full(pad, fill)])
+        return state
+
+    def add_run(self, data_dict: Dict[str, np.ndarray]):
+        for field, values in data_dict.items():
+            # empty and non-numeric fields are not exported, same as in util.run_dict_to_field_dict
+            if len(values) == 0 or values.dtype.kind not in "biuf":
+                continue
+            values = preprocess_run(values, self.settings)
+            state = self._field_state(field, len(values))
+            n = len(values)
+            valid = np.isfinite(values)
+            idx = np.flatnonzero(valid)
+            x = values[idx]
+
+            state["count"][idx] += 1
+            delta = x - state["mean"][idx]
+            state["mean"][idx] += delta / state["count"][idx]
+            state["m2"][idx] += delta * (x - state["mean"][idx])
+            state["min"][:n] = np.fmin(state["min"][:n], np.where(valid, values, np.inf))
+            state["max"][:n] = np.fmax(state["max"][:n], np.where(valid, values, -np.inf))
+            if self.quantiles:
+                state["runs"].append(values)
+
+    def result(self) -> Dict[str, Dict[str, np.ndarray]]:
+        """Returns one dictionary per field with one array per statistic, NaN for steps without any value"""
+        out = {}
+        for field, state in self.fields.items():
+            count = state["count"]
+            empty = count == 0
+            stats = {}
+            for statistic in self.settings["statistics"]:
+                if statistic == "count":
+                    stats[statistic] = count.astype(np.int64)
+                elif statistic == "mean":
+                    stats[statistic] = np.where(empty, np.nan, state["mean"])
+                elif statistic == "std":
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        stats[statistic] = np.where(empty, np.nan, np.sqrt(state["m2"] / count))
+                elif statistic in ("min", "max"):
+                    stats[statistic] = np.where(empty, np.nan, state[statistic])
+            if self.quantiles:
+                matrix = np.full((len(state["runs"]), len(count)), np.nan)
+                for k, values in enumerate(state["runs"]):
+                    matrix[k, :len(values)] = values
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", category=RuntimeWarning)
+                    for statistic in self.quantiles:
+                        stats[statistic] = np.nanquantile(matrix, quantile_of(statistic), axis=0)
+            out[field] = stats
+        return out
+
+
+def aggregate_to_field_dict(aggregator: StreamingAggregator, config: dict) -> Dict:
+    """Converts the result of an aggregator to the structure of util.run_dict_to_field_dict.
+    For NumPy, each statistic is a separate entry '<field>/<statistic>', which is saved as <field>/<statistic>.npy.
+    For CSV, each field is a dataframe with one column per statistic and one row per step.
+    """
+    output_dict = {}
+    for field, stats in aggregator.result().items():
+        print(f"Aggregated {aggregator.fields[field]['count'].max():.0f} runs of field {field} into {list(stats.keys())}")
+        if config.get("output_data_type", None) == "csv":
+            output_dict[field] = pd.DataFrame(stats, index=[f"step {i}" for i in range(len(next(iter(stats.values()))))])
+        else:
+            for statistic, values in stats.items():
+                output_dict[f"{field}/{statistic}"] = values
+    return output_dict
+
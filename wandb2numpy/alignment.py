@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+from typing import Dict, List
+
+def get_align_settings(config: dict) -> dict:
+    """Returns the alignment settings of an experiment config with defaults filled in"""
+    align = config.get("align", {}) or {}
+    return {
+        "x_key": align.get("x_key", "_step"),
+        "grid_size": align.get("grid_size", 1000),
+        "method": align.get("method", "interp"),
+        "x_min": align.get("x_min", None),
+        "x_max": align.get("x_max", None),
+    }
+
+
+def build_grid(x_arrays: List[np.ndarray], grid_size: int, x_min=None, x_max=None) -> np.ndarray:
+    """Builds a grid shared by all runs of an experiment, covering the x values of all runs.
+    If all x values are integers (e.g. _step) and fit into grid_size points, the grid contains every integer.
+    """
+    non_empty = [x[np.isfinite(x)] for x in x_arrays if len(x) > 0]
+    non_empty = [x for x in non_empty if len(x) > 0]
+    if not non_empty:
+        return np.array([])
+    low = min(x.min() for x in non_empty) if x_min is None else x_min
+    high = max(x.max() for x in non_empty) if x_max is None else x_max
+
+    is_integer = all(np.all(np.floor(x) == x) for x in non_empty)
+    if is_integer and high - low + 1 <= grid_size:
+        return np.arange(low, high + 1, dtype=np.float64)
+    return np.linspace(low, high, grid_size)
+
+
+def align_run(x: np.ndarray, y: np.ndarray, grid: np.ndarray, method: str = "interp") -> np.ndarray:
+    """Resamples the values y, logged at x, onto the grid. Grid points outside of the range of x are NaN.
+    Arguments:
+        x {np.ndarray} -- x values of the run, e.g. _step
+        y {np.ndarray} -- values of the field
+        grid {np.ndarray} -- sorted grid points
+        method {str} -- 'interp' for linear interpolation, 'bin' for the mean of all values closest to each grid point
+    Returns:
+        np.ndarray -- one value per grid point
+    """
+    y = y.astype(np.float64)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+    out = np.full(len(grid), np.nan)
+    if len(x) == 0 or len(grid) == 0:
+        return out
+
+    order = np.argsort(x, kind="stable")
+    x, y = x[order], y[order]
+
+    if method == "interp":
+        out = np.interp(grid, x, y, left=np.nan, right=np.nan)
+    else:
+        # each value belongs to the bin of its closest grid point, bins are delimited by the midpoints between grid points
+        edges = (grid[1:] + grid[:-1]) / 2
+        if len(grid) > 1:
+            in_range = (x >= 2 * grid[0] - edges[0]) & (x <= 2 * grid[-1] - edges[-1])
+        else:
+            in_range = np.ones(len(x), dtype=bool)
+        bins = np.searchsorted(edges, x[in_range])
+        counts = np.bincount(bins, minlength=len(grid))
+        sums = np.bincount(bins, weights=y[in_range], minlength=len(grid))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = np.where(counts > 0, sums / counts, np.nan)
+    return out
+
+
+def build_run_grid(run_dicts: List[Dict], config: dict) -> np.ndarray:
+    """Builds the grid of an experiment from the x_key values of all its runs"""
+    settings = get_align_settings(config)
+    x_arrays = [run_dict.get(settings["x_key"], np.array([])).astype(np.float64) for run_dict in run_dicts]
+    return build_grid(x_arrays, settings["grid_size"], settings["x_min"], settings["x_max"])
+
+
+def align_run_dict(run_dict: Dict, config: dict, grid: np.ndarray = None) -> Dict:
+    """Alternative to util.run_dict_to_field_dict that aligns all runs on a shared grid of the x_key (e.g. _step)
+    instead of the row index, so that runs with different lengths or sampled histories stay comparable.
+    Arguments:
+        run_dict {dict} -- one entry per run, holding a dictionary with one array per field, including the x_key
+        config {dict} -- experiment config with an 'align' entry
+        grid {np.ndarray} -- grid to align on, e.g. shared by all groups of an experiment. Built from the runs if None.
+    Returns:
+        dict -- one (runs, grid) matrix per field and the grid itself under the x_key
+    """
+    settings = get_align_settings(config)
+    x_key, method = settings["x_key"], settings["method"]
+    n_runs = len(run_dict)
+
+    x_arrays = [run_dict[i].get(x_key, np.array([])).astype(np.float64) for i in range(n_runs)]
+    if grid is None:
+        grid = build_run_grid([run_dict[i] for i in range(n_runs)], config)
+    print(f"Aligning runs on a grid of {len(grid)} points of {x_key} using method '{method}'")
+
+    all_fields = set()
+    for x in list(run_dict.keys()):
+        all_fields.update(list(run_dict[x].keys()))
+    all_fields.discard(x_key)
+
+    output_dict = {}
+    for field in all_fields:
+        rows = [i for i in range(n_runs) if field in run_dict[i].keys() and len(run_dict[i][field]) != 0
+                and run_dict[i][field].dtype.kind in "biuf" and len(x_arrays[i]) == len(run_dict[i][field])]
+        skipped = [i for i in range(n_runs) if field in run_dict[i].keys() and len(run_dict[i][field]) != 0 and i not in rows]
+        if skipped:
+            print(f"Warning: {len(skipped)} runs of field {field} have no matching {x_key} values or are not numeric, skipping them")
+        print(f"Number of runs that include field {field}: {len(rows)}")
+
+        output_array = np.empty((len(rows), len(grid)))
+        for k, i in enumerate(rows):
+            output_array[k] = align_run(x_arrays[i], run_dict[i][field], grid, method)
+
+        if "output_data_type" in config.keys() and config["output_data_type"] == "csv":
+            row_names = [f"run {i}" for i in range(0, output_array.shape[0])]
+            output_dict[field] = pd.DataFrame(output_array, index=row_names, columns=[f"{x_key} {x:g}" for x in grid])
+        else:
+            output_dict[field] = output_array
+
+    output_dict[x_key] = pd.DataFrame({x_key: grid}) if config.get("output_data_type", None) == "csv" else grid
+    return output_dict
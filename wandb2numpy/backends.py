@@ -0,0 +1,158 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from typing import Dict, List, Optional
+
+METADATA_KEY = "wandb2numpy.runs"
+TABLE_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow", "hdf5": ".h5"}
+
+
+def run_metadata(run, idx: int) -> dict:
+    return {
+        "run": idx,
+        "name": run.name,
+        "id": getattr(run, "id", None),
+        "group": run.group,
+        "job_type": run.job_type,
+        "config": dict(getattr(run, "config", None) or {}),
+    }
+
+
+def run_data_to_table(run_list: List, run_data: List[Dict[str, np.ndarray]]) -> pd.DataFrame:
+    """Combines the data of all runs of an experiment into one long table with one row per run and step
+    and one column per field. Fields that are shorter than the longest field of a run are padded with NaN.
+    The metadata of the runs (name, id, group, job type, config) is stored in table.attrs["runs"].
+    Arguments:
+        run_list {List} -- list of wandb runs
+        run_data {List[dict]} -- extracted data of each run, in the same order as run_list
+    Returns:
+        pd.DataFrame -- columns run, group, job_type, step and one column per field
+    """
+    fields = sorted({f for d in run_data for f, v in d.items() if len(v) > 0 and v.dtype.kind in "biuf"})
+    lengths = np.array([max((len(d[f]) for f in fields if f in d), default=0) for d in run_data], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    columns = {
+        "run": np.repeat(np.arange(len(run_list)), lengths),
+        "group": np.repeat(np.array([str(run.group) for run in run_list], dtype=object), lengths),
+        "job_type": np.repeat(np.array([str(run.job_type) for run in run_list], dtype=object), lengths),
+        "step": np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths),
+    }
+    for field in fields:
+        column = np.full(offsets[-1], np.nan)
+        for j, d in enumerate(run_data):
+            if field in d and len(d[field]) > 0 and d[field].dtype.kind in "biuf":
+                column[offsets[j]:offsets[j] + len(d[field])] = d[field]
+        columns[field] = column
+
+    table = pd.DataFrame(columns)
+    table.attrs["runs"] = [run_metadata(run, j) for j, run in enumerate(run_list)]
+    print(f"Table with {len(fields)} fields and {len(table)} rows from {len(run_list)} runs")
+    return table
+
+
+def get_compression(config: dict, field: str, default: Optional[str]) -> Optional[str]:
+    """compression can be a codec name for all fields or a dict with one codec per field and an optional 'default' entry"""
+    compression = config.get("compression", default)
+    if isinstance(compression, dict):
+        return compression.get(field, compression.get("default", default))
+    return compression
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Output data types 'parquet' and 'arrow' require pyarrow, install it with 'pip install pyarrow'")
+    return pyarrow
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("Output data type 'hdf5' requires h5py, install it with 'pip install h5py'")
+    return h5py
+
+
+def _to_arrow(table: pd.DataFrame):
+    pa = _import_pyarrow()
+    arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+    metadata = dict(arrow_table.schema.metadata or {})
+    metadata[METADATA_KEY.encode()] = json.dumps(table.attrs.get("runs", []), default=str).encode()
+    return arrow_table.replace_schema_metadata(metadata)
+
+
+def save_parquet(table: pd.DataFrame, file_path: str, config: dict):
+    pa = _import_pyarrow()
+    compression = {column: get_compression(config, column, "zstd") or "none" for column in table.columns}
+    pa.parquet.write_table(_to_arrow(table), file_path, compression=compression)
+
+
+def save_arrow(table: pd.DataFrame, file_path: str, config: dict):
+    pa = _import_pyarrow()
+    # the Arrow IPC format compresses all columns with the same codec
+    pa.feather.write_feather(_to_arrow(table), file_path, compression=get_compression(config, "default", "lz4") or "uncompressed")
+
+
+def save_hdf5(table: pd.DataFrame, file_path: str, config: dict):
+    h5py = _import_h5py()
+    chunk_size = min(config.get("hdf5_chunk_size", 65536), max(len(table), 1))
+    with h5py.File(file_path, "w") as f:
+        f.attrs[METADATA_KEY] = json.dumps(table.attrs.get("runs", []), default=str)
+        for column in table.columns:
+            data = table[column].to_numpy()
+            if data.dtype == object:
+                data = data.astype(h5py.string_dtype())
+            compression = get_compression(config, column, "gzip")
+            f.create_dataset(column, data=data, chunks=(chunk_size,) if len(data) > 0 else None,
+                             compression=compression if len(data) > 0 else None)
+
+
+TABLE_BACKENDS = {"parquet": save_parquet, "arrow": save_arrow, "hdf5": save_hdf5}
+
+
+def load_table(file_path: str, fields: List[str] = None, runs: List[int] = None) -> pd.DataFrame:
+    """Loads a table written with output_data_type 'parquet', 'arrow' or 'hdf5', reading only the requested fields
+    Arguments:
+        file_path {str} -- path of the .parquet, .arrow or .h5 file
+        fields {List[str]} -- fields to load, all fields if None. The columns run, group, job_type and step are always loaded.
+        runs {List[int]} -- indices of the runs to load, all runs if None
+    Returns:
+        pd.DataFrame -- table with the run metadata in table.attrs["runs"]
+    """
+    index_columns = ["run", "group", "job_type", "step"]
+    columns = None if fields is None else index_columns + [f for f in fields if f not in index_columns]
+    extension = os.path.splitext(file_path)[1]
+
+    if extension == ".h5":
+        h5py = _import_h5py()
+        with h5py.File(file_path, "r") as f:
+            columns = columns or list(f.keys())
+            run_index = f["run"][:]
+            mask = slice(None) if runs is None else np.isin(run_index, runs)
+            data = {}
+            for column in columns:
+                values = f[column][:][mask]
+                data[column] = values.astype(str) if f[column].dtype.kind in "OS" else values
+            metadata = json.loads(f.attrs[METADATA_KEY])
+        table = pd.DataFrame(data)
+    else:
+        pa = _import_pyarrow()
+        filters = None if runs is None else [("run", "in", list(runs))]
+        if extension == ".parquet":
+            arrow_table = pa.parquet.read_table(file_path, columns=columns, filters=filters)
+        else:
+            arrow_table = pa.feather.read_table(file_path, columns=columns)
+            if runs is not None:
+                arrow_table = arrow_table.filter(pa.compute.is_in(arrow_table["run"], pa.array(list(runs))))
+        metadata = json.loads(arrow_table.schema.metadata[METADATA_KEY.encode()])
+        table = arrow_table.to_pandas()
+
+    table.attrs["runs"] = metadata if runs is None else [m for m in metadata if m["run"] in set(runs)]
+    return table
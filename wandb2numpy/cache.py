@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+
+from tqdm import tqdm
+from typing import Dict, List, Optional, Tuple
+from wandb2numpy import profiling, util
+
+# runs in one of these states will not log any more data, so their cached history never becomes outdated
+FINAL_RUN_STATES = ("finished", "crashed", "failed", "killed")
+
+
+class HistoryCache:
+    """Content-addressed on-disk cache of extracted run histories.
+    Each entry consists of a .npz file holding one array per field and a .json file holding metadata,
+    both named after the hash of entity, project, run id, requested fields and history sample mode.
+    """
+
+    def __init__(self, cache_dir: str, max_size_mb: float = 1024, refresh: bool = False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 ** 2
+        self.refresh = refresh
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def entry_key(run, fields, config: dict) -> str:
+        key_dict = {
+            "entity": run.entity,
+            "project": run.project,
+            "run_id": run.id,
+            "fields": fields if isinstance(fields, str) else sorted(fields),
+            "history_samples": config.get("history_samples", None),
+        }
+        return hashlib.sha256(json.dumps(key_dict, sort_keys=True).encode()).hexdigest()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        return os.path.join(self.cache_dir, key + ".npz"), os.path.join(self.cache_dir, key + ".json")
+
+    def load(self, key: str) -> Optional[Tuple[Dict[str, np.ndarray], dict]]:
+        data_path, meta_path = self._paths(key)
+        if not os.path.isfile(data_path) or not os.path.isfile(meta_path):
+            return None
+
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        with np.load(data_path) as npz:
+            data_dict = {field: npz[f"arr_{i}"] for i, field in enumerate(meta["fields"])}
+
+        # mark entry as recently used for LRU eviction
+        os.utime(data_path)
+        os.utime(meta_path)
+        return data_dict, meta
+
+    def save(self, key: str, data_dict: Dict[str, np.ndarray], meta: dict):
+        data_path, meta_path = self._paths(key)
+        fields = list(data_dict.keys())
+        # object arrays (e.g. dict valued fields) are never exported, store them as empty arrays to avoid pickling
+        arrays = [np.array([]) if data_dict[f].dtype == object else data_dict[f] for f in fields]
+
+        with util.atomic_write(data_path) as f:
+            np.savez(f, *arrays)
+        with util.atomic_write(meta_path, "w") as f:
+            json.dump({**meta, "fields": fields}, f)
+
+    def evict(self):
+        """Deletes least recently used entries until the cache is smaller than max_size"""
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".npz"):
+                continue
+            data_path, meta_path = self._paths(file_name[:-4])
+            # experiments that are exported concurrently may evict the same entries, skip entries that vanished meanwhile
+            try:
+                size = os.path.getsize(data_path) + (os.path.getsize(meta_path) if os.path.isfile(meta_path) else 0)
+                entries.append((os.path.getmtime(data_path), size, data_path, meta_path))
+            except OSError:
+                continue
+            total_size += size
+
+        for _, size, data_path, meta_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            for path in (data_path, meta_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total_size -= size
+
+    def extract_data(self, run, fields, config: dict, extract_fn) -> Dict[str, np.ndarray]:
+        """Returns the data of a run from the cache if possible, only downloading what is missing.
+        Finished runs are served from the cache without any request. For running runs with full history,
+        only steps after the last cached step are downloaded.
+        Arguments:
+            run -- wandb run
+            fields {List[str] or str} -- fields to be extracted
+            config {dict} -- experiment config
+            extract_fn -- function with the signature of util.extract_data that downloads the data
+        Returns:
+            dict -- one entry per field, same as util.extract_data
+        """
+        key = self.entry_key(run, fields, config)
+        incremental = config.get("history_samples", None) == "all"
+        cached = None if self.refresh else self.load(key)
+
+        data_dict = None
+        if cached is not None:
+            cached_dict, meta = cached
+            profiling.count("cache_hits")
+            if meta["state"] in FINAL_RUN_STATES:
+                return strip_steps(cached_dict, fields)
+
+            if incremental and meta["last_step"] is not None:
+                new_dict = extract_fn(run, fields, config, min_step=meta["last_step"] + 1, with_steps=True)
+                data_dict = append_history(cached_dict, new_dict)
+                if data_dict is None:
+                    tqdm.write(f"Warning: Fields of run {run.name} changed since it was cached, downloading full history")
+
+        if data_dict is None:
+            profiling.count("cache_misses")
+            data_dict = extract_fn(run, fields, config, with_steps=incremental)
+
+        steps = data_dict.get("_step", [])
+        self.save(key, data_dict, {"state": run.state, "last_step": int(steps[-1]) if len(steps) > 0 else None})
+        return strip_steps(data_dict, fields)
+
+
+def append_history(cached_dict: Dict[str, np.ndarray], new_dict: Dict[str, np.ndarray]) -> Optional[Dict[str, np.ndarray]]:
+    """Appends newly downloaded steps to the cached arrays. Returns None if the new data does not fit to the cached data.
+    A field that is missing in all cached or all new steps has an empty array there, which is filled with NaN
+    if the field has values in the other part, as a full download would do."""
+    if len(new_dict.get("_step", [])) == 0:
+        return cached_dict
+    if set(new_dict.keys()) != set(cached_dict.keys()):
+        return None
+
+    n_cached, n_new = len(cached_dict["_step"]), len(new_dict["_step"])
+    out = {}
+    for k in cached_dict.keys():
+        old_values, new_values = cached_dict[k], new_dict[k]
+        if len(old_values) == 0 and len(new_values) == 0:
+            out[k] = old_values
+            continue
+        if len(old_values) == 0 and new_values.dtype.kind in "biuf":
+            old_values = np.full(n_cached, np.nan)
+        if len(new_values) == 0 and old_values.dtype.kind in "biuf":
+            new_values = np.full(n_new, np.nan)
+        if len(old_values) != n_cached or len(new_values) != n_new:
+            return None
+        out[k] = np.concatenate([old_values, new_values])
+    return out
+
+
+def strip_steps(data_dict: Dict[str, np.ndarray], fields) -> Dict[str, np.ndarray]:
+    """Removes the _step array that is only stored for incremental downloads, unless it was requested as a field"""
+    if not isinstance(fields, str) and "_step" in fields:
+        return data_dict
+    return {k: v for k, v in data_dict.items() if k != "_step"}
+
+
+def get_history_cache(config: dict) -> Optional[HistoryCache]:
+    """Creates a HistoryCache if cache_dir is specified in the experiment config, otherwise returns None"""
+    if not config.get("cache_dir", None):
+        return None
+    return HistoryCache(config["cache_dir"], config.get("max_cache_size", 1024), config.get("refresh_cache", False))
+
+
+class CachedRun:
+    """Run restored from the run list cache. The attributes used for filtering and caching are available without
+    any request, everything else (e.g. history) is forwarded to the wandb run, which is loaded on first access."""
+
+    METADATA = ("id", "name", "entity", "project", "group", "job_type", "state", "tags", "config", "summary_metrics",
+                "history_keys", "lastHistoryStep", "updatedAt")
+
+    def __init__(self, metadata: dict, api):
+        self.__dict__.update(metadata)
+        self._api = api
+        self._run = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def metadata(cls, run) -> dict:
+        return {key: getattr(run, key, None) for key in cls.METADATA}
+
+    def __getattr__(self, name):
+        # only called for attributes that are not part of the cached metadata
+        if name.startswith("__") or name in ("_api", "_run", "_lock"):
+            raise AttributeError(name)
+        with self._lock:
+            if self._run is None:
+                profiling.count("run_requests")
+                self._run = self._api.run(f"{self.entity}/{self.project}/{self.id}")
+        return getattr(self._run, name)
+
+
+class RunListCache:
+    """On-disk cache of the runs matching a query, storing the metadata of each run as a .json file named after the hash
+    of the path and filters of the query. Entries that are older than ttl seconds are ignored."""
+
+    def __init__(self, cache_dir: str, ttl: float, refresh: bool = False):
+        self.cache_dir = os.path.join(cache_dir, "run_lists")
+        self.ttl = ttl
+        self.refresh = refresh
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, path: str, filters: dict) -> str:
+        key = hashlib.sha256(json.dumps({"path": path, "filters": filters}, sort_keys=True, default=str).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def load(self, path: str, filters: dict, api) -> Optional[List[CachedRun]]:
+        file_path = self._path(path, filters)
+        if self.refresh or not os.path.isfile(file_path) or time.time() - os.path.getmtime(file_path) > self.ttl:
+            return None
+        with open(file_path, "r") as f:
+            return [CachedRun(metadata, api) for metadata in json.load(f)]
+
+    def save(self, path: str, filters: dict, run_list: List):
+        with util.atomic_write(self._path(path, filters), "w") as f:
+            json.dump([CachedRun.metadata(run) for run in run_list], f, default=str)
+
+
+def get_run_list_cache(config: dict) -> Optional[RunListCache]:
+    """Creates a RunListCache if cache_dir and run_list_ttl are specified in the experiment config, otherwise returns None"""
+    if not config.get("cache_dir", None) or not config.get("run_list_ttl", None):
+        return None
+    return RunListCache(config["cache_dir"], config["run_list_ttl"], config.get("refresh_cache", False))
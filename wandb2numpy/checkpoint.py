@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import numpy as np
+
+from typing import Dict, Optional
+from wandb2numpy import util
+from wandb2numpy.cache import FINAL_RUN_STATES
+from wandb2numpy.filtering import build_run_filters
+
+# checkpoints that are in use, so that experiments of one export with the same checkpoint directory share the manifest
+_open_checkpoints = {}
+_open_lock = threading.Lock()
+
+
+class RunCheckpoint:
+    """Persists the extracted data of every run of an export as soon as it is downloaded, so that an interrupted export
+    can be resumed without downloading the completed runs again.
+    The checkpoint of an export is a directory named after the hash of entity, project, run filters, fields and history
+    sample mode, holding one .npz file per run and a manifest.json that lists the completed runs. Both are written atomically,
+    so a crash never leaves a run that is listed in the manifest without its data.
+    An entry is only reused if the run was in a final state when it was saved or has not logged any steps since.
+    Use get_checkpoint to open a checkpoint, which is shared by all exports that use the same directory at the same time
+    and removed once all of them downloaded their runs.
+    """
+
+    def __init__(self, checkpoint_dir: str, fields, config: dict):
+        key_dict = self.key_dict(fields, config)
+        self.directory = self.directory_for(checkpoint_dir, fields, config)
+        self.manifest_path = os.path.join(self.directory, "manifest.json")
+        self.lock = threading.Lock()
+        self.n_users = 0
+        self.completed = True
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.manifest = {**key_dict, "runs": {}}
+        if os.path.isfile(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                self.manifest = json.load(f)
+
+    @staticmethod
+    def key_dict(fields, config: dict) -> dict:
+        return {
+            "entity": config["entity"],
+            "project": config["project"],
+            "filters": build_run_filters(config),
+            "fields": fields if isinstance(fields, str) else sorted(fields),
+            "history_samples": config.get("history_samples", None),
+        }
+
+    @classmethod
+    def directory_for(cls, checkpoint_dir: str, fields, config: dict) -> str:
+        key = hashlib.sha256(json.dumps(cls.key_dict(fields, config), sort_keys=True, default=str).encode()).hexdigest()
+        return os.path.join(checkpoint_dir, key)
+
+    def _entry(self, run) -> Optional[dict]:
+        """Returns the manifest entry of a run, None if there is none or the run logged new steps since it was saved"""
+        entry = self.manifest["runs"].get(run.id, None)
+        if entry is None:
+            return None
+        if entry["state"] in FINAL_RUN_STATES:
+            return entry
+        last_step = entry.get("last_history_step", None)
+        return entry if last_step is not None and last_step == getattr(run, "lastHistoryStep", None) else None
+
+    def __contains__(self, run) -> bool:
+        return self._entry(run) is not None
+
+    def load(self, run) -> Optional[Dict[str, np.ndarray]]:
+        """Returns the checkpointed data of a run, None if the run was not completed yet or is outdated"""
+        entry = self._entry(run)
+        if entry is None:
+            return None
+        with np.load(os.path.join(self.directory, entry["file"])) as npz:
+            return {field: npz[f"arr_{i}"] for i, field in enumerate(entry["fields"])}
+
+    def save(self, run, data_dict: Dict[str, np.ndarray]):
+        fields = list(data_dict.keys())
+        # object arrays are never exported, store them as empty arrays to avoid pickling
+        arrays = [np.array([]) if data_dict[f].dtype == object else data_dict[f] for f in fields]
+        file_name = f"{run.id}.npz"
+        with util.atomic_write(os.path.join(self.directory, file_name)) as f:
+            np.savez(f, *arrays)
+
+        with self.lock:
+            self.manifest["runs"][run.id] = {"name": run.name, "state": run.state, "file": file_name, "fields": fields,
+                                             "last_history_step": getattr(run, "lastHistoryStep", None)}
+            with util.atomic_write(self.manifest_path, "w") as f:
+                json.dump(self.manifest, f)
+
+    def release(self, completed: bool):
+        """Called by every export that opened the checkpoint with get_checkpoint once it finished. The checkpoint is deleted
+        after the last export released it, unless one of them was interrupted and has to be resumed."""
+        with _open_lock:
+            self.n_users -= 1
+            self.completed = self.completed and completed
+            if self.n_users > 0:
+                return
+            _open_checkpoints.pop(self.directory, None)
+            if self.completed:
+                shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def get_checkpoint(fields, config: dict) -> Optional[RunCheckpoint]:
+    """Creates a RunCheckpoint if resume is set in the experiment config, otherwise returns None.
+    Checkpoints are stored in checkpoint_dir, or in output_path/.checkpoints if checkpoint_dir is not specified."""
+    if not config.get("resume", False):
+        return None
+    checkpoint_dir = config.get("checkpoint_dir", None)
+    if checkpoint_dir is None and config.get("output_path", None):
+        checkpoint_dir = os.path.join(config["output_path"], ".checkpoints")
+    if checkpoint_dir is None:
+        print("Error: resume requires checkpoint_dir or output_path to be specified. Exporting without checkpoints...")
+        return None
+    with _open_lock:
+        directory = RunCheckpoint.directory_for(checkpoint_dir, fields, config)
+        checkpoint = _open_checkpoints.get(directory, None)
+        if checkpoint is None:
+            checkpoint = _open_checkpoints[directory] = RunCheckpoint(checkpoint_dir, fields, config)
+        checkpoint.n_users += 1
+    return checkpoint
@@ -1,23 +1,122 @@
 import argparse
+import json
+import sys
 
 from wandb2numpy.config_loader import load_config
-from wandb2numpy.export import export_data
-from wandb2numpy.save_experiment import create_output_dirs, save_matrix
+from wandb2numpy.plan import compile_config
 
-parser = argparse.ArgumentParser(description='Export data from wandb to numpy array or csv')
-parser.add_argument("config_path")
-parser.add_argument('-o', action='store_true')
-parser.add_argument('-e', '--experiments', nargs='+', default=None,
-                       help='Allows to specify which experiments should be exported.')
-args = parser.parse_args()
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Export data from wandb to numpy array or csv')
+    parser.add_argument("config_path")
+    parser.add_argument('-o', action='store_true')
+    parser.add_argument('-e', '--experiments', nargs='+', default=None,
+                           help='Allows to specify which experiments should be exported.')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                           help='Number of runs whose history is downloaded concurrently. Overwrites n_workers in the config.')
+    parser.add_argument('--retries', type=int, default=None,
+                           help='Number of retries if downloading a run history times out. Overwrites max_retries in the config.')
+    parser.add_argument('--timeout', type=float, default=None,
+                           help='Timeout of requests to wandb in seconds. Overwrites api_timeout in the config.')
+    parser.add_argument('--resume', action='store_true',
+                           help='Keep a checkpoint of every downloaded run and skip runs that an interrupted export already completed.')
+    parser.add_argument('--sync', action='store_true',
+                           help='Update the .npy files of a previous sync in place, only downloading new runs and new steps.')
+    parser.add_argument('--watch', nargs='?', type=float, const=60.0, default=None, metavar='SECONDS',
+                           help='Sync repeatedly, waiting the given number of seconds (default 60) between polls, until interrupted.')
+    parser.add_argument('--no-cache', action='store_true',
+                           help='Do not read or write the history cache, even if cache_dir is specified in the config.')
+    parser.add_argument('--refresh', action='store_true',
+                           help='Download all histories again and overwrite the corresponding cache entries.')
+    parser.add_argument('-p', '--parallel-experiments', type=int, default=1,
+                           help='Number of experiments that are exported concurrently.')
+    parser.add_argument('--profile', nargs='?', const=True, default=None, metavar='JSON_PATH',
+                           help='Print a summary of where the export spent its time. If a path is given, the statistics are also saved there as JSON.')
+    parser.add_argument('--dry-run', action='store_true',
+                           help='Only validate the config and print the run filters of each experiment, without connecting to wandb.')
+    return parser
+
+def print_plans(plans):
+    for plan in plans:
+        print(f"Experiment {plan.name}: runs of {plan.path}")
+        print(f"    filters: {json.dumps(plan.filters)}")
+        print(f"    fields: {plan.fields if isinstance(plan.fields, str) else list(plan.fields)}")
+        print(f"    output: {plan.output_data_type or 'numpy'} in {plan.output_path}")
+    print(f"Config is valid, {len(plans)} experiments")
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
     config = load_config(args.config_path)
+    if config is None:
+        sys.exit("Aborting execution because of invalid config file")
+
+    overrides = {}
+    if args.workers is not None:
+        overrides["n_workers"] = args.workers
+    if args.retries is not None:
+        overrides["max_retries"] = args.retries
+    if args.timeout is not None:
+        overrides["api_timeout"] = args.timeout
+    if args.resume:
+        overrides["resume"] = True
+    if args.no_cache:
+        overrides["cache_dir"] = None
+    if args.refresh:
+        overrides["refresh_cache"] = True
+    if args.o:
+        overrides["overwrite"] = True
+
+    plans = compile_config(config, args.experiments, from_command_line=True, overrides=overrides)
+    if plans is None:
+        sys.exit("Aborting execution because of invalid config file")
+
+    if args.dry_run:
+        print_plans(plans)
+        return
+
+    # imported here, so that --help and --dry-run do not have to import wandb and pandas
+    from wandb2numpy.backends import TABLE_BACKENDS
+    from wandb2numpy.export import export_data
+    from wandb2numpy.save_experiment import create_output_dirs, save_lod_levels, save_matrix, save_ragged_experiment, save_table
+    from wandb2numpy.sync import sync_data
+
+    if args.sync or args.watch is not None:
+        sync_data(plans, interval=args.watch)
+        return
+
+    experiment_data_dict, config_list, stats = export_data(plans, n_parallel_experiments=args.parallel_experiments, return_stats=True)
+    # skipped experiments are missing in experiment_data_dict, so match configs by name instead of position
+    config_dict = {plan.name: experiment_config for plan, experiment_config in zip(plans, config_list)}
+
+    for experiment in experiment_data_dict.keys():
+        experiment_config = config_dict[experiment]
+        output_data_type = experiment_config.get("output_data_type", None)
+        experiment_dir = create_output_dirs(experiment_config, experiment)
+        with stats.timer("save_matrix"):
+            if output_data_type == "memmap":
+                # memory mapped outputs are already written during the export
+                pass
+            elif output_data_type == "ragged":
+                save_ragged_experiment(experiment_data_dict[experiment], experiment_dir, experiment, args.o)
+            elif output_data_type in TABLE_BACKENDS:
+                save_table(experiment_data_dict[experiment], experiment_dir, experiment, args.o, experiment_config)
+            else:
+                for field in experiment_data_dict[experiment]:
+                    save_matrix(experiment_data_dict[experiment], experiment_dir, field, args.o, experiment_config)
+
+        if experiment_config.get("lod_levels", None):
+            if experiment_config.get("history_samples", None) != "all":
+                print(f"Warning: lod_levels of experiment {experiment} are built from sampled histories, set history_samples to 'all' to keep all peaks")
+            with stats.timer("save_lod_levels"):
+                for field in experiment_data_dict[experiment]:
+                    save_lod_levels(experiment_data_dict[experiment], experiment_dir, field, args.o, experiment_config)
+
+    if args.profile is not None:
+        print(stats.summary_table())
+        if isinstance(args.profile, str):
+            stats.save_json(args.profile)
+            print(f"Saved profile to file {args.profile}")
 
-    experiment_data_dict, config_list = export_data(config, args.experiments, from_command_line=True)
-    
-    for i, experiment in enumerate(experiment_data_dict.keys()):
-        experiment_dir = create_output_dirs(config_list[i], experiment)
 
-        for field in experiment_data_dict[experiment]:
-            save_matrix(experiment_data_dict[experiment], experiment_dir, field, args.o, config_list[i])
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
+import re
 import yaml
 
-from copy import deepcopy
 from typing import List, Tuple
-from wandb2numpy import util
+
+# the table types are the keys of backends.TABLE_BACKENDS, which is not imported here so that validating a config
+# does not import pandas
+TABLE_OUTPUT_TYPES = ["parquet", "arrow", "hdf5"]
+OUTPUT_DATA_TYPES = ["numpy", "csv", "memmap", "ragged"] + TABLE_OUTPUT_TYPES
+FLOAT_DTYPES = ["float16", "float32", "float64"]
 
 
 def load_config(config_path: str) -> dict:
@@ -23,14 +28,14 @@ def parse_config(config: dict, experiment_list: List[str]) -> Tuple[dict, List[d
     Returns:
         Tuple[dict, List[dict], List[str]] -- the default config, a list of all experiment configs, a list of all experiment names
     """
-    default_config = config.pop('DEFAULT', None)
+    default_config = config.get('DEFAULT', None)
     if default_config is None:
         print("No DEFAULT entry found in config")
 
     experiment_configs = []
     experiment_names = []
     for experiment in config.keys():
-        if experiment_list is None or experiment in experiment_list:
+        if experiment != 'DEFAULT' and (experiment_list is None or experiment in experiment_list):
             experiment_configs.append(config[experiment])
             experiment_names.append(experiment)
 
@@ -42,66 +47,146 @@ def check_valid_configs(default_config, experiment_configs, experiment_names, fr
     if from_command_line:
         required_params.append("output_path")
 
-    optional_filter_lists = ["groups", "job_types", "runs"]
-    optional_filter_dicts = ["config, summary"]
+    optional_filter_lists = ["groups", "job_types", "runs", "tags"]
+    optional_filter_dicts = ["config", "summary"]
 
+    # all configs are checked, so that every error is reported at once
+    is_valid = True
     for parameter in required_params:
         if default_config is None or parameter not in default_config.keys():
             for i, exp_config in enumerate(experiment_configs):
                 if parameter not in exp_config.keys():
                     print(f"Error: {parameter} is neither specified in DEFAULT nor in {experiment_names[i]}")
-                    return False
+                    is_valid = False
 
     # check that all parameters have the correct format if they are included
     if default_config is not None:
-        is_valid_config = check_data_types(default_config, "DEFAULT", required_params, optional_filter_lists, optional_filter_dicts)
-        
-        if not is_valid_config:
-                return False
+        if not check_data_types(default_config, "DEFAULT", required_params, optional_filter_lists, optional_filter_dicts):
+            is_valid = False
 
     for j, exp_config in enumerate(experiment_configs):
-        is_valid_config = check_data_types(exp_config, experiment_names[j], required_params, optional_filter_lists, optional_filter_dicts)
-        if not is_valid_config:
-            return False
+        if not check_data_types(exp_config, experiment_names[j], required_params, optional_filter_lists, optional_filter_dicts):
+            is_valid = False
 
-    return True
+    return is_valid
 
 def check_data_types(config: dict, config_name: str, required_params: List, optional_filter_lists: List, optional_filter_dicts: List):
+    is_valid = True
     for required_param in required_params:
             if required_param in config.keys():
                 if not isinstance(required_param, str):
                     print(f"Error: {required_param} in {config_name} is not of type String")
-                    return False
+                    is_valid = False
 
     for opt_list in optional_filter_lists:
         if opt_list in config.keys():
             if not isinstance(config[opt_list], List) and config[opt_list] != "all":
                 print(f"Error: {opt_list} in {config_name} is not of type List or equal to 'all'")
-                return False
+                is_valid = False
 
     for opt_dict in optional_filter_dicts:
         if opt_dict in config.keys():
             if not isinstance(config[opt_dict], dict):
                 print(f"Error: {opt_dict} in {config_name} is not of type Dict")
-                return False
+                is_valid = False
+            elif not check_filter_dict(opt_dict, config[opt_dict], config_name):
+                is_valid = False
+
+    if 'history_samples' in config.keys() and config['history_samples'] != "all" and (
+            not isinstance(config['history_samples'], int) or isinstance(config['history_samples'], bool) or config['history_samples'] < 1):
+        print(f"Error: history_samples in {config_name} must be 'all' or an Integer >= 1")
+        is_valid = False
+
+    if not check_int_param('n_workers', config, config_name, minimum=1):
+        is_valid = False
+    if not check_int_param('max_retries', config, config_name, minimum=0):
+        is_valid = False
+    if 'retry_backoff' in config.keys() and not isinstance(config['retry_backoff'], (int, float)):
+        print(f"Error: retry_backoff in {config_name} is not a number")
+        is_valid = False
+    if 'api_timeout' in config.keys() and (not isinstance(config['api_timeout'], (int, float)) or config['api_timeout'] <= 0):
+        print(f"Error: api_timeout in {config_name} is not a positive number")
+        is_valid = False
+    if 'resume' in config.keys() and not isinstance(config['resume'], bool):
+        print(f"Error: resume in {config_name} is not of type Bool")
+        is_valid = False
+    if 'checkpoint_dir' in config.keys() and not isinstance(config['checkpoint_dir'], str):
+        print(f"Error: checkpoint_dir in {config_name} is not of type String")
+        is_valid = False
+    if not check_int_param('history_page_size', config, config_name, minimum=1):
+        is_valid = False
+    if 'spill_dir' in config.keys() and not isinstance(config['spill_dir'], str):
+        print(f"Error: spill_dir in {config_name} is not of type String")
+        is_valid = False
+    if config.get('output_data_type', None) is not None and config['output_data_type'] not in OUTPUT_DATA_TYPES:
+        print(f"Error: output_data_type in {config_name} must be one of {', '.join(OUTPUT_DATA_TYPES)}, not {config['output_data_type']}")
+        is_valid = False
+    if 'compression' in config.keys() and not check_compression(config['compression'], config_name):
+        is_valid = False
+    if not check_int_param('hdf5_chunk_size', config, config_name, minimum=1):
+        is_valid = False
+    if 'compact_float_dtype' in config.keys() and config['compact_float_dtype'] not in FLOAT_DTYPES:
+        print(f"Error: compact_float_dtype in {config_name} must be one of {', '.join(FLOAT_DTYPES)}")
+        is_valid = False
+    if 'align' in config.keys() and not check_align(config['align'], config_name):
+        is_valid = False
+    if 'aggregate' in config.keys() and not check_aggregate(config['aggregate'], config_name):
+        is_valid = False
+    if 'cache_dir' in config.keys() and config['cache_dir'] is not None and not isinstance(config['cache_dir'], str):
+        print(f"Error: cache_dir in {config_name} is not of type String")
+        is_valid = False
+    if 'max_cache_size' in config.keys() and not isinstance(config['max_cache_size'], (int, float)):
+        print(f"Error: max_cache_size in {config_name} is not a number")
+        is_valid = False
+    if 'run_list_ttl' in config.keys() and not isinstance(config['run_list_ttl'], (int, float)):
+        print(f"Error: run_list_ttl in {config_name} is not a number")
+        is_valid = False
+    if not check_int_param('runs_per_page', config, config_name, minimum=1):
+        is_valid = False
+    if 'batch_run_queries' in config.keys() and not isinstance(config['batch_run_queries'], bool):
+        print(f"Error: batch_run_queries in {config_name} is not of type Bool")
+        is_valid = False
+    if 'lod_levels' in config.keys() and (not isinstance(config['lod_levels'], List)
+                                          or not all(isinstance(f, int) and not isinstance(f, bool) and f >= 2 for f in config['lod_levels'])):
+        print(f"Error: lod_levels in {config_name} is not a List of Integers >= 2")
+        is_valid = False
+
+    if not is_valid:
+        # the nesting checks below rely on the types of the filter lists
+        return False
 
     # if groups are provided as a list, runs and job_types must be nested lists with equal length (if they are provided)
     if 'groups' in config.keys() and config['groups'] != "all":
-        if not check_nested_list('job_types', config):
-            return False
-        if not check_nested_list('runs', config):
-            return False
-        if not check_nested_list('tags', config):
-            return False
+        for param_name in ['job_types', 'runs', 'tags']:
+            if not check_nested_list(param_name, config):
+                is_valid = False
     else:
-        if not check_not_nested('job_types', config):
-            return False
-        if not check_not_nested('runs', config):
-            return False
-        if not check_not_nested('tags', config):
-            return False
+        for param_name in ['job_types', 'runs', 'tags']:
+            if not check_not_nested(param_name, config):
+                is_valid = False
 
-    return True
+    return is_valid
+
+def check_merged_configs(experiment_configs: List[dict], experiment_names: List[str]) -> bool:
+    """Checks the combinations of parameters that are only valid together, after merging each experiment with DEFAULT"""
+    is_valid = True
+    for config, config_name in zip(experiment_configs, experiment_names):
+        output_data_type = config.get('output_data_type', None)
+        if config.get('aggregate', None) and output_data_type not in [None, "numpy", "csv"]:
+            # the statistics of an aggregated field are single arrays, which only the numpy and csv outputs can save
+            print(f"Error: aggregate in {config_name} is only supported for output_data_type 'numpy' and 'csv', not {output_data_type}")
+            is_valid = False
+        if config.get('align', None) and output_data_type not in [None, "numpy", "csv"]:
+            # the other outputs store the runs as they were logged and would ignore align
+            print(f"Error: align in {config_name} is only supported for output_data_type 'numpy' and 'csv', not {output_data_type}")
+            is_valid = False
+        if config.get('align', None) and config.get('aggregate', None):
+            print(f"Error: align and aggregate can not be combined in {config_name}")
+            is_valid = False
+        if config.get('lod_levels', None) and output_data_type not in [None, "numpy", "memmap"]:
+            print(f"Error: lod_levels in {config_name} are only supported for output_data_type 'numpy' and 'memmap', not {output_data_type}")
+            is_valid = False
+    return is_valid
 
 def check_nested_list(param_name: str, config: dict):
     if param_name in config.keys():
@@ -123,6 +208,69 @@ def check_not_nested(param_name: str, config: dict):
                 return False
     return True
 
+def check_filter_dict(dict_name: str, filter_dict: dict, config_name: str):
+    # each entry specifies a list of allowed values and/or a range with min and max
+    is_valid = True
+    for key, entry in filter_dict.items():
+        if not isinstance(entry, dict) or not any(k in entry.keys() for k in ["values", "min", "max"]):
+            print(f"Error: {key} in {dict_name} of {config_name} must be a Dict with values, min and/or max")
+            is_valid = False
+        elif 'values' in entry.keys() and not isinstance(entry['values'], List):
+            print(f"Error: values of {key} in {dict_name} of {config_name} is not of type List")
+            is_valid = False
+    return is_valid
+
+def check_int_param(param_name: str, config: dict, config_name: str, minimum: int = 0):
+    if param_name in config.keys():
+        if not isinstance(config[param_name], int) or config[param_name] < minimum:
+            print(f"Error: {param_name} in {config_name} must be an Integer >= {minimum}")
+            return False
+    return True
+
+def check_align(align: dict, config_name: str):
+    if not isinstance(align, dict):
+        print(f"Error: align in {config_name} is not of type Dict")
+        return False
+    if 'method' in align.keys() and align['method'] not in ["interp", "bin"]:
+        print(f"Error: align method in {config_name} must be 'interp' or 'bin'")
+        return False
+    if not check_int_param('grid_size', align, f"align of {config_name}", minimum=1):
+        return False
+    if 'x_key' in align.keys() and not isinstance(align['x_key'], str):
+        print(f"Error: x_key in align of {config_name} is not of type String")
+        return False
+    return True
+
+def check_compression(compression, config_name: str):
+    # a codec for all fields, or a dict with one codec per field and an optional 'default' entry
+    codecs = list(compression.values()) if isinstance(compression, dict) else [compression]
+    if not all(codec is None or isinstance(codec, str) for codec in codecs):
+        print(f"Error: compression in {config_name} must be a String or a Dict of Strings")
+        return False
+    return True
+
+def check_aggregate(aggregate: dict, config_name: str):
+    if not isinstance(aggregate, dict):
+        print(f"Error: aggregate in {config_name} is not of type Dict")
+        return False
+    statistics = aggregate.get('statistics', [])
+    valid_statistics = ["mean", "std", "min", "max", "count", "median"]
+    if not isinstance(statistics, List) or not all(s in valid_statistics or re.fullmatch(r"q(100|\d{1,2}(\.\d+)?)", str(s)) for s in statistics):
+        print(f"Error: statistics in aggregate of {config_name} must be a list containing {', '.join(valid_statistics)} or quantiles like q25")
+        return False
+    smoothing = aggregate.get('smoothing', {}) or {}
+    if not isinstance(smoothing, dict):
+        print(f"Error: smoothing in aggregate of {config_name} is not of type Dict")
+        return False
+    if not check_int_param('window', smoothing, f"smoothing of {config_name}", minimum=1):
+        return False
+    if 'ema' in smoothing.keys() and not (isinstance(smoothing['ema'], (int, float)) and 0 <= smoothing['ema'] < 1):
+        print(f"Error: ema in smoothing of {config_name} must be a number in [0, 1)")
+        return False
+    if not check_int_param('downsample', aggregate, f"aggregate of {config_name}", minimum=1):
+        return False
+    return True
+
 def merge_default(default_config: dict, experiment_configs: List[dict]) -> List[dict]:
     """merges each individual experiment configuration with the default parameters
     Arguments:
@@ -134,10 +282,15 @@ def merge_default(default_config: dict, experiment_configs: List[dict]) -> List[
     if default_config is None:
         return experiment_configs
 
-    expanded_exp_configs = []
-    for c in experiment_configs:
-        merge_c = deepcopy(default_config)
-        merge_c = util.deep_update(merge_c, c)
-        expanded_exp_configs.append(merge_c)
+    return [merge_dicts(default_config, c) for c in experiment_configs]
 
-    return expanded_exp_configs
\ No newline at end of file
+def merge_dicts(base_dict: dict, update_dict: dict) -> dict:
+    """Returns a new dictionary with the entries of base_dict, overwritten by the entries of update_dict, including nested dictionaries.
+    Unlike util.deep_update, neither dictionary is modified, and values that are not dictionaries are shared instead of copied."""
+    merged = dict(base_dict)
+    for key, value in update_dict.items():
+        if isinstance(value, dict) and isinstance(merged.get(key, None), dict):
+            merged[key] = merge_dicts(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
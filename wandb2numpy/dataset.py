@@ -0,0 +1,192 @@
+import os
+import numpy as np
+
+from typing import Dict, List
+from wandb2numpy import profiling
+from wandb2numpy.alignment import get_align_settings
+from wandb2numpy.export import get_to_field_dict, prepare_configs
+from wandb2numpy.fetching import create_api, fetch_run_data
+from wandb2numpy.fields import resolve_fields
+from wandb2numpy.filtering import get_filtered_runs
+
+# output data types whose files hold one complete matrix per field and can be loaded instead of downloading
+FILE_BACKED_TYPES = (None, "numpy", "memmap")
+
+
+def open_dataset(config: Dict, experiments_list: List[str] = None, overrides: Dict = None) -> "Dataset":
+    """Lazy alternative to export_data: returns a Dataset that only downloads the data of a field when it is indexed.
+    Example:
+        dataset = open_dataset(config)
+        view = dataset["my_experiment"]
+        print(view.runs, view.groups, view.fields)
+        rewards = view.select(group="baseline")["reward"]
+    Arguments:
+        config {dict} -- config dictionary or compiled ExportPlans, same as for export_data
+        experiments_list {List[str]} -- experiments that are part of the dataset. If None, all experiments are used.
+        overrides {dict} -- parameters that overwrite the corresponding entries of every experiment config
+    Returns:
+        Dataset -- one ExperimentView per experiment
+    """
+    experiment_names, config_list = prepare_configs(config, experiments_list, overrides=overrides)
+    return Dataset(experiment_names, config_list)
+
+
+class Dataset:
+    """Experiments of a config, which are only queried when they are accessed. Indexing by experiment name
+    returns a memoized ExperimentView."""
+
+    def __init__(self, experiment_names: List[str], config_list: List[Dict]):
+        self.configs = dict(zip(experiment_names, config_list))
+        self._views = {}
+        self._api = None
+
+    @property
+    def api(self):
+        if self._api is None:
+            self._api = create_api(list(self.configs.values()))
+        return self._api
+
+    @property
+    def experiments(self) -> List[str]:
+        return list(self.configs.keys())
+
+    def __len__(self) -> int:
+        return len(self.configs)
+
+    def __iter__(self):
+        return iter(self.configs)
+
+    def __contains__(self, experiment: str) -> bool:
+        return experiment in self.configs
+
+    def __getitem__(self, experiment: str) -> "ExperimentView":
+        if experiment not in self._views:
+            if experiment not in self.configs:
+                raise KeyError(f"Experiment {experiment} is not part of the dataset")
+            self._views[experiment] = ExperimentView(experiment, self.configs[experiment], self)
+        return self._views[experiment]
+
+    def release(self, experiment: str = None):
+        """Drops the loaded data and runs of an experiment, or of all experiments if experiment is None"""
+        for name in ([experiment] if experiment is not None else list(self._views.keys())):
+            self._views.pop(name, None)
+
+    def __repr__(self) -> str:
+        return f"Dataset(experiments={self.experiments})"
+
+
+class ExperimentView:
+    """Runs of an experiment, or of a selection of its groups and job types. The runs are queried on first access,
+    and the matrix of a field is assembled when the field is indexed and kept until it is released.
+    If the experiment was already exported with output_data_type 'numpy' or 'memmap', the fields of the whole experiment
+    are loaded from the output files as memory maps instead of being downloaded."""
+
+    def __init__(self, name: str, config: Dict, dataset: Dataset, runs: List = None, selection: Dict = None):
+        self.name = name
+        self.config = config
+        self.dataset = dataset
+        self.selection = selection or {}
+        self._runs = runs
+        self._fields = None
+        self._data = {}
+
+    @property
+    def run_list(self) -> List:
+        if self._runs is None:
+            with profiling.timer("get_filtered_runs"):
+                self._runs = get_filtered_runs(self.config, self.dataset.api)
+        return self._runs
+
+    @property
+    def runs(self) -> List[str]:
+        return [run.name for run in self.run_list]
+
+    @property
+    def groups(self) -> Dict[str, List[str]]:
+        """Job types of each group of the runs"""
+        groups = {}
+        for run in self.run_list:
+            job_types = groups.setdefault(run.group, [])
+            if run.job_type not in job_types:
+                job_types.append(run.job_type)
+        return groups
+
+    @property
+    def output_dir(self):
+        """Directory of the exported files of this experiment, None if they can not be used"""
+        if self.selection or "output_path" not in self.config.keys() or self.config.get("output_data_type", None) not in FILE_BACKED_TYPES:
+            return None
+        output_dir = os.path.join(".", self.config["output_path"], self.name)
+        return output_dir if os.path.isdir(output_dir) else None
+
+    def _file_path(self, field: str):
+        output_dir = self.output_dir
+        if output_dir is None:
+            return None
+        file_path = os.path.join(output_dir, *field.split("/")) + ".npy"
+        return file_path if os.path.isfile(file_path) else None
+
+    @property
+    def fields(self) -> List[str]:
+        """Fields of the experiment, listed from the output files if present, otherwise from the run summaries"""
+        if self._fields is None:
+            output_dir = self.output_dir
+            if output_dir is not None:
+                self._fields = sorted(os.path.relpath(os.path.join(root, f), output_dir)[:-len(".npy")].replace(os.sep, "/")
+                                      for root, _, files in os.walk(output_dir) for f in files if f.endswith(".npy"))
+            if not self._fields:
+                fields = resolve_fields(self.config["fields"], self.run_list)
+                self._fields = [] if isinstance(fields, str) else fields
+        return self._fields
+
+    def select(self, group: str = None, job_type: str = None) -> "ExperimentView":
+        """Returns a view of the runs with the given group and/or job type, sharing the already queried runs"""
+        runs = [run for run in self.run_list if (group is None or run.group == group) and (job_type is None or run.job_type == job_type)]
+        selection = {**self.selection, **{k: v for k, v in (("group", group), ("job_type", job_type)) if v is not None}}
+        return ExperimentView(self.name, self.config, self.dataset, runs, selection)
+
+    def load(self, fields: List[str]) -> Dict[str, np.ndarray]:
+        """Loads several fields at once, downloading all fields that are not loaded yet in a single pass over the runs"""
+        for field in fields:
+            file_path = self._file_path(field) if field not in self._data else None
+            if file_path is not None:
+                self._data[field] = np.load(file_path, mmap_mode="r")
+
+        missing = [field for field in fields if field not in self._data]
+        if missing:
+            fetch_fields = list(missing)
+            x_key = get_align_settings(self.config)["x_key"]
+            if self.config.get("align", None) and x_key not in fetch_fields:
+                fetch_fields.append(x_key)
+
+            run_dict = {}
+            for j, run, data_dict in fetch_run_data(self.run_list, fetch_fields, self.config):
+                run_dict[j] = data_dict
+            with profiling.timer("run_dict_to_field_dict"):
+                field_dict = get_to_field_dict(self.config)({j: run_dict[j] for j in range(len(run_dict))}, self.config)
+            for field in missing:
+                if field not in field_dict:
+                    raise KeyError(f"Field {field} has no numeric values in the runs of experiment {self.name}")
+                self._data[field] = field_dict[field]
+        return {field: self._data[field] for field in fields}
+
+    def __getitem__(self, field: str):
+        return self.load([field])[field]
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.fields
+
+    @property
+    def loaded(self) -> List[str]:
+        return list(self._data.keys())
+
+    def release(self, field: str = None):
+        """Drops the loaded data of a field, or of all fields if field is None, so that it can be garbage collected"""
+        if field is None:
+            self._data.clear()
+        else:
+            self._data.pop(field, None)
+
+    def __repr__(self) -> str:
+        selection = "".join(f", {k}={v}" for k, v in self.selection.items())
+        return f"ExperimentView({self.name}{selection}, loaded={self.loaded})"
@@ -1,75 +1,219 @@
-import wandb
 import sys
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from tqdm import tqdm
-from typing import Dict, List, Tuple
-from wandb2numpy import util
+from typing import Dict, List, Optional, Tuple
+from wandb2numpy import profiling, util
+from wandb2numpy.aggregation import StreamingAggregator, aggregate_to_field_dict
+from wandb2numpy.alignment import align_run_dict, build_run_grid, get_align_settings
 
-from wandb2numpy.config_loader import parse_config, check_valid_configs, merge_default
-from wandb2numpy.filtering import get_filtered_runs
+from wandb2numpy.backends import TABLE_BACKENDS, run_data_to_table
+from wandb2numpy.fields import resolve_fields
+from wandb2numpy.fetching import ProgressReporter, create_api, fetch_run_data
+from wandb2numpy.filtering import get_filtered_runs, get_filtered_runs_batched
+from wandb2numpy.plan import check_plans, compile_config
+from wandb2numpy.ragged import run_dict_to_ragged_dict
+from wandb2numpy.save_experiment import MemmapExperimentWriter, create_output_dirs
 
 
 def export_data(config: Dict,
                 experiments_list: List[str] = None,
                 from_command_line: bool = False,
                 by_group_and_job_type: bool = False,
+                overrides: Dict = None,
+                n_parallel_experiments: int = 1,
+                return_stats: bool = False,
                 ) -> Tuple[Dict[str, any], List[Dict]]:
     """Exports data to numpy or pandas, according to specifications provided in the config dictionary
     Arguments:
-        config {dict} -- config dictionary
+        config {dict} -- config dictionary, or the ExportPlans of a config compiled with compile_config
         experiment_list {List[str]} -- a list of experiments to be exported. If None, all experiments are exported.
         from_command_line {bool} -- ?
         by_group_and_job_type {bool} -- If true, the runs are grouped by wandb group name and job type
+        overrides {dict} -- parameters that overwrite the corresponding entries of every experiment config (e.g. set from the command line)
+        n_parallel_experiments {int} -- number of experiments that are exported concurrently, sharing one wandb.Api.
+            If > 1, an experiment that fails is skipped instead of aborting the whole export.
+        return_stats {bool} -- If true, an ExportStats object with timings and counters of the export is returned as third value
     Returns:
         experiment_data_dict {dict} -- One top-level entry per exported experiment. On the next level, one entry per exported field.
-        Value for each field is either a pandas dataframe or a numpy array, 
-        depending on the specification in the config dict.
+        Value for each field is either a pandas dataframe, a numpy array or a RaggedArray,
+        depending on the specification in the config dict. For the output data types 'parquet', 'arrow' and 'hdf5',
+        the value of each experiment is a single pandas dataframe with one column per field instead.
         config_list {List[dict]} -- List of individual configs for each experiment after inheriting from and overwriting DEFAULT
+        stats {ExportStats} -- only if return_stats is true
     """
-    default_config, experiment_configs, experiment_names = parse_config(config, experiments_list)
-    valid_configs = check_valid_configs(default_config, experiment_configs, experiment_names, from_command_line)
-    if not valid_configs:
-        sys.exit("Aborting execution because of invalid config file")
-    config_list = merge_default(default_config, experiment_configs)
-    
-    api = wandb.Api(timeout=15)
+    with profiling.collect() as stats:
+        experiment_data_dict, config_list = _export_data(config, experiments_list, from_command_line, by_group_and_job_type,
+                                                         overrides, n_parallel_experiments)
+    if return_stats:
+        return experiment_data_dict, config_list, stats
+    return experiment_data_dict, config_list
+
+
+def prepare_configs(config, experiments_list: List[str] = None, from_command_line: bool = False,
+                    overrides: Dict = None) -> Tuple[List[str], List[Dict]]:
+    """Validates the config and returns the names and merged configs of the selected experiments, see export_data.
+    config can also be a sequence of ExportPlans returned by compile_config, which are used without validating them again."""
+    with profiling.timer("parse_config"):
+        if isinstance(config, (list, tuple)):
+            plans = [plan.with_overrides(overrides) for plan in config if experiments_list is None or plan.name in experiments_list]
+            if overrides and not check_plans(plans, from_command_line):
+                sys.exit("Aborting execution because of invalid overrides")
+        else:
+            plans = compile_config(config, experiments_list, from_command_line, overrides)
+            if plans is None:
+                sys.exit("Aborting execution because of invalid config file")
+        return [plan.name for plan in plans], [plan.config for plan in plans]
+
+
+def get_to_field_dict(config: Dict):
+    """Returns the function that converts the runs of an experiment to one entry per field, depending on the config"""
+    if config.get("align", None):
+        return align_run_dict
+    elif config.get("output_data_type", None) == "ragged":
+        return run_dict_to_ragged_dict
+    return util.run_dict_to_field_dict
+
+
+def _export_data(config, experiments_list, from_command_line, by_group_and_job_type, overrides, n_parallel_experiments):
+    experiment_names, config_list = prepare_configs(config, experiments_list, from_command_line, overrides)
+
+    api = create_api(config_list)
+
+    # experiments of the same project share one query for their runs
+    with profiling.timer("get_filtered_runs"):
+        run_lists = get_filtered_runs_batched(config_list, api)
+
+    # experiments with the same runs only scan their summaries once, a later call discovers fields that were added since
+    field_cache = {}
+    results = {}
+    if n_parallel_experiments <= 1 or len(config_list) <= 1:
+        for i, config in enumerate(config_list):
+            results[experiment_names[i]] = export_experiment(experiment_names[i], config, api, by_group_and_job_type,
+                                                             run_list=run_lists[i], field_cache=field_cache)
+    else:
+        # one progress bar for the runs of all experiments, experiments add their runs once they are known
+        progress = ProgressReporter(0)
+        with ThreadPoolExecutor(max_workers=n_parallel_experiments) as executor:
+            futures = {executor.submit(export_experiment, experiment_names[i], config, api, by_group_and_job_type, progress,
+                                       run_lists[i], field_cache): experiment_names[i]
+                       for i, config in enumerate(config_list)}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as exc:
+                    tqdm.write(f"Error: Export of experiment {futures[future]} failed ({exc!r}). Skipping...")
+        progress.close()
+
+    # keep the order of the experiments in the config
+    experiment_data_dict = {name: results[name] for name in experiment_names if results.get(name) is not None}
+    return experiment_data_dict, config_list
+
+
+def export_experiment(experiment_name: str, config: Dict, api, by_group_and_job_type: bool = False, progress=None,
+                      run_list: List = None, field_cache: Dict = None) -> Optional[Dict]:
+    """Exports a single experiment, see export_data
+    Arguments:
+        experiment_name {str} -- name of the experiment
+        config {dict} -- experiment config after merging with DEFAULT
+        api {wandb.Api} -- wandb API
+        by_group_and_job_type {bool} -- If true, the runs are grouped by wandb group name and job type
+        progress {ProgressReporter} -- shared progress bar, if None each experiment shows its own
+        run_list {List} -- runs of the experiment if they were already queried, if None they are queried here
+        field_cache {dict} -- fields discovered per set of runs, shared by the experiments of one export_data call
+    Returns:
+        dict -- one entry per field (nested by group and job type if by_group_and_job_type), None if the experiment is skipped
+    """
+    print(f"Processing experiment {experiment_name} ...")
+    if run_list is None:
+        with profiling.timer("get_filtered_runs"):
+            run_list = get_filtered_runs(config, api)
 
-    experiment_data_dict = {}
+    if not run_list:
+        print("Warning: No matching runs founds for this experiment. Skipping...")
+        return None
 
-    for i, config in enumerate(config_list): 
-        print(f"Processing experiment {experiment_names[i]} ...")
-        run_list = get_filtered_runs(config, api)
+    print("Found following runs that match the filters:")
+    for run in run_list:
+        print(run.name)
 
-        if not run_list:
-            print("Warning: No matching runs founds for this experiment. Skipping...")
-            continue
+    if 'history_samples' in config.keys() and config['history_samples'] != "all":
+        print(f"Using sampled history of runs with sample size {config['history_samples']}. Runs that are shorter than that keep their original length.")
 
-        print("Found following runs that match the filters:")
-        for run in run_list:
-            print(run.name)
+    # resolve "all" and field patterns once per experiment, so that only the needed keys are requested for each run
+    with profiling.timer("resolve_fields"):
+        fields = resolve_fields(config["fields"], run_list, field_cache)
+    if fields != config["fields"]:
+        print(f"Exporting fields: {fields}")
+
+    if config.get("align", None) and not isinstance(fields, str) and get_align_settings(config)["x_key"] not in fields:
+        # the x values are needed to align the runs, if fields is 'all', extract_data adds them
+        fields = fields + [get_align_settings(config)["x_key"]]
+
+    if progress is not None:
+        progress.add_runs(len(run_list))
+
+    if config.get("aggregate", None):
+        # reduce each run as soon as it arrives, only the statistics are kept in memory
+        aggregators = {}
+        for j, run, current_run_dict in fetch_run_data(run_list, fields, config, progress):
+            key = (run.group, run.job_type) if by_group_and_job_type else ()
+            with profiling.timer("aggregate"):
+                aggregators.setdefault(key, StreamingAggregator(config)).add_run(current_run_dict)
+        with profiling.timer("aggregate"):
+            if not by_group_and_job_type:
+                return aggregate_to_field_dict(aggregators[()], config)
+            out = util.nested_dict(dict)
+            for (group_name, job_type), aggregator in aggregators.items():
+                out[group_name][job_type] = aggregate_to_field_dict(aggregator, config)
+            return util.default_to_regular(out)
 
-        if 'history_samples' in config.keys() and config['history_samples'] != "all":
-            print(f"Using sampled history of runs with sample size {config['history_samples']}. Runs that are shorter than that keep their original length.")
+    if config.get("output_data_type", None) == "memmap":
+        if "output_path" not in config.keys():
+            print("Error: output_path must be specified for output_data_type 'memmap'. Skipping...")
+            return None
+        # write each run into the output files as soon as it arrives instead of collecting all runs in memory
+        writer = MemmapExperimentWriter(create_output_dirs(config, experiment_name), run_list, config,
+                                        by_group_and_job_type, config.get("overwrite", False))
+        for j, run, current_run_dict in fetch_run_data(run_list, fields, config, progress):
+            with profiling.timer("write_memmap"):
+                writer.write_run(j, current_run_dict)
+        with profiling.timer("write_memmap"):
+            return writer.finalize()
 
-        all_runs_dict = util.nested_dict()
+    all_runs_dict = util.nested_dict()
 
-        for j, run in enumerate(tqdm(run_list)):
-            current_run_dict = util.extract_data(run, config["fields"], config)
-            if by_group_and_job_type:
-                all_runs_dict[run.group][run.job_type].append(current_run_dict)
-            else:
-                all_runs_dict[j] = current_run_dict
+    # histories may arrive out of order when downloaded concurrently, restore the order of run_list
+    run_data = [None] * len(run_list)
+    for j, run, current_run_dict in fetch_run_data(run_list, fields, config, progress):
+        run_data[j] = current_run_dict
 
+    if config.get("output_data_type", None) in TABLE_BACKENDS:
+        # one table per experiment, groups and job types are columns of the table
+        with profiling.timer("run_data_to_table"):
+            return run_data_to_table(run_list, run_data)
+
+    for j, run in enumerate(run_list):
+        current_run_dict = run_data[j]
+        if by_group_and_job_type:
+            all_runs_dict[run.group][run.job_type].append(current_run_dict)
+        else:
+            all_runs_dict[j] = current_run_dict
+
+    to_field_dict = get_to_field_dict(config)
+    if config.get("align", None) and by_group_and_job_type:
+        # all groups and job types are aligned on one grid, built from all runs of the experiment
+        to_field_dict = partial(align_run_dict, grid=build_run_grid(run_data, config))
+
+    with profiling.timer("run_dict_to_field_dict"):
         if by_group_and_job_type:
             out = util.nested_dict(dict)
             for group_name, group_runs in all_runs_dict.items():
                 for job_type, runs in group_runs.items():
-                    field_dict = util.run_dict_to_field_dict({k: v for k, v in enumerate(runs)}, config)
+                    field_dict = to_field_dict({k: v for k, v in enumerate(runs)}, config)
                     out[group_name][job_type] = field_dict
-            experiment_data_dict[experiment_names[i]] = util.default_to_regular(out)
+            return util.default_to_regular(out)
         else:
-            field_dict = util.run_dict_to_field_dict(all_runs_dict, config)
-            experiment_data_dict[experiment_names[i]] = field_dict
-
-    return experiment_data_dict, config_list
+            return to_field_dict(all_runs_dict, config)
@@ -0,0 +1,202 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+from typing import Dict, Iterator, List, Tuple
+from wandb2numpy import profiling, util
+from wandb2numpy.cache import get_history_cache
+from wandb2numpy.checkpoint import get_checkpoint
+
+# errors that are worth retrying, everything else is raised immediately. wandb is only imported once it is needed,
+# so that importing wandb2numpy stays fast
+_retriable_exceptions = None
+
+
+def retriable_exceptions() -> tuple:
+    global _retriable_exceptions
+    if _retriable_exceptions is None:
+        import requests
+        import wandb
+        _retriable_exceptions = (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                                 requests.exceptions.HTTPError, wandb.errors.CommError)
+    return _retriable_exceptions
+
+
+def is_retriable(exc: Exception) -> bool:
+    """Returns True for transient errors: timeouts, connection errors and HTTP errors with status 5xx or 429.
+    Other client errors (4xx), e.g. a wrong project or missing permissions, would fail again and are not retried.
+    wandb.errors.CommError wraps the underlying requests error in exc.exc
+    """
+    import requests
+    cause = getattr(exc, "exc", None) or exc
+    if isinstance(cause, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    response = getattr(cause, "response", None)
+    status = getattr(response, "status_code", None)
+    return status is not None and (status >= 500 or status == 429)
+
+
+def create_api(config_list: List[dict]):
+    """Creates the wandb.Api shared by the experiments, using the most patient api_timeout of them (default 15s)"""
+    import wandb
+    return wandb.Api(timeout=max((c.get("api_timeout", 15) for c in config_list), default=15))
+
+
+def get_fetch_settings(config: dict) -> Tuple[int, int, float]:
+    """Reads the settings for downloading run histories from an experiment config
+    Arguments:
+        config {dict} -- experiment config
+    Returns:
+        Tuple[int, int, float] -- number of worker threads, maximum number of retries, initial backoff in seconds
+    """
+    n_workers = config.get("n_workers", 1)
+    max_retries = config.get("max_retries", 3)
+    retry_backoff = config.get("retry_backoff", 1.0)
+    return n_workers, max_retries, retry_backoff
+
+
+def call_with_retry(fn, config: dict, description: str):
+    """Calls fn and retries with exponential backoff if the request times out, the connection fails
+    or the server responds with 5xx or 429
+    Arguments:
+        fn -- function without arguments that sends the request
+        config {dict} -- experiment config with the retry settings
+        description {str} -- description of the request for warnings, e.g. 'Fetching history of run x'
+    Returns:
+        the return value of fn, the last error is raised if all attempts failed
+    """
+    _, max_retries, retry_backoff = get_fetch_settings(config)
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except retriable_exceptions() as exc:
+            if not is_retriable(exc):
+                raise
+            profiling.count("retries")
+            if attempt >= max_retries:
+                raise
+            delay = retry_backoff * 2 ** attempt
+            tqdm.write(f"Warning: {description} failed ({exc}), retrying in {delay:.2f}s ...")
+            time.sleep(delay)
+            attempt += 1
+
+
+def extract_data_with_retry(run, fields, config: dict, **kwargs) -> dict:
+    """Calls util.extract_data and retries with exponential backoff if the request times out
+    Arguments:
+        run -- wandb run
+        fields {List[str] or str} -- fields to be extracted
+        config {dict} -- experiment config
+        kwargs -- additional keyword arguments passed to util.extract_data
+    Returns:
+        dict -- one entry per field, same as util.extract_data
+    """
+    return call_with_retry(lambda: util.extract_data(run, fields, config, **kwargs), config,
+                           f"Fetching history of run {run.name}")
+
+
+def fetch_run(run, fields, config: dict, cache=None, checkpoint=None) -> dict:
+    """Extracts the data of a single run, going through the history cache if one is given.
+    With a checkpoint, runs that were completed by a previous export are loaded from the checkpoint
+    and downloaded runs are added to it."""
+    start = time.perf_counter()
+    with profiling.timer("fetch_run"):
+        data_dict = checkpoint.load(run) if checkpoint is not None else None
+        if data_dict is not None:
+            profiling.count("checkpoint_hits")
+        else:
+            if cache is None:
+                data_dict = extract_data_with_retry(run, fields, config)
+            else:
+                data_dict = cache.extract_data(run, fields, config, extract_data_with_retry)
+            if checkpoint is not None:
+                checkpoint.save(run, data_dict)
+    stats = profiling.active_stats()
+    if stats is not None:
+        stats.record_run(time.perf_counter() - start, data_dict)
+    return data_dict
+
+
+def fetch_run_data(run_list: List, fields, config: dict, progress=None) -> Iterator[Tuple[int, any, Dict]]:
+    """Downloads the history of all runs in run_list, using a thread pool if n_workers > 1.
+    Results are yielded in order of completion, together with the index of the run in run_list,
+    so that callers can restore a deterministic run order.
+    Arguments:
+        run_list {List} -- list of wandb runs
+        fields {List[str] or str} -- fields to be extracted
+        config {dict} -- experiment config
+        progress {ProgressReporter} -- shared progress bar, e.g. when several experiments are exported in parallel
+    Yields:
+        Tuple[int, Run, dict] -- index in run_list, run, dictionary with one entry per field
+    """
+    cache = get_history_cache(config)
+    checkpoint = get_checkpoint(fields, config)
+    if checkpoint is not None:
+        n_completed = sum(run in checkpoint for run in run_list)
+        if n_completed > 0:
+            print(f"Resuming export, {n_completed} of {len(run_list)} runs are loaded from checkpoint {checkpoint.directory}")
+    own_progress = progress is None
+    if own_progress:
+        progress = ProgressReporter(len(run_list))
+
+    completed = False
+    try:
+        yield from _fetch_runs(run_list, fields, config, progress, cache, checkpoint)
+        completed = True
+    finally:
+        # an interrupted export keeps its checkpoint
+        if checkpoint is not None:
+            checkpoint.release(completed)
+    if own_progress:
+        progress.close()
+
+    if cache is not None:
+        cache.evict()
+
+
+def _fetch_runs(run_list: List, fields, config: dict, progress, cache, checkpoint) -> Iterator[Tuple[int, any, Dict]]:
+    n_workers, _, _ = get_fetch_settings(config)
+    if n_workers <= 1 or len(run_list) <= 1:
+        for j, run in enumerate(run_list):
+            data_dict = fetch_run(run, fields, config, cache, checkpoint)
+            progress.update(data_dict)
+            yield j, run, data_dict
+    else:
+        executor = ThreadPoolExecutor(max_workers=min(n_workers, len(run_list)))
+        futures = {executor.submit(fetch_run, run, fields, config, cache, checkpoint): j for j, run in enumerate(run_list)}
+        try:
+            for future in as_completed(futures):
+                j = futures[future]
+                data_dict = future.result()
+                progress.update(data_dict)
+                yield j, run_list[j], data_dict
+        finally:
+            # don't start any more downloads if a run failed or the caller stopped early
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ProgressReporter:
+    """Progress bar over runs that additionally shows the number of history rows received per second and the peak memory usage"""
+
+    def __init__(self, n_runs: int):
+        self.bar = tqdm(total=n_runs)
+        self.start = time.perf_counter()
+        self.n_rows = 0
+        self.lock = threading.Lock()
+
+    def add_runs(self, n_runs: int):
+        with self.lock:
+            self.bar.total += n_runs
+            self.bar.refresh()
+
+    def update(self, data_dict: Dict):
+        with self.lock:
+            self.n_rows += max((len(v) for v in data_dict.values()), default=0)
+            elapsed = max(time.perf_counter() - self.start, 1e-9)
+            self.bar.set_postfix({"rows/s": f"{self.n_rows / elapsed:.0f}", "peak RSS": f"{util.peak_rss_mb():.0f}MB"}, refresh=False)
+            self.bar.update(1)
+
+    def close(self):
+        self.bar.close()
@@ -0,0 +1,119 @@
+import fnmatch
+import json
+import re
+
+from typing import Dict, List, Optional, Union
+
+# value types in the historyKeys of a run that can be exported as arrays
+NUMERIC_HISTORY_TYPES = ("number", "boolean")
+
+
+def is_field_pattern(field: str) -> bool:
+    """Fields starting with 're:' are regular expressions, fields containing *, ? or [ are glob patterns"""
+    return field.startswith("re:") or any(c in field for c in "*?[")
+
+
+def match_field_pattern(pattern: str, field: str) -> bool:
+    if pattern.startswith("re:"):
+        return re.fullmatch(pattern[3:], field) is not None
+    return fnmatch.fnmatchcase(field, pattern)
+
+
+def get_summary(run) -> dict:
+    summary = getattr(run, "summary_metrics", None)
+    if summary is None:
+        summary = getattr(run, "summary", None)
+    return dict(summary) if summary is not None else {}
+
+
+def get_history_keys(run) -> Optional[Dict[str, int]]:
+    """Returns the number of history rows containing each numeric key of a run, based on the historyKeys in the run metadata.
+    Returns None if the run has no such metadata."""
+    history_keys = getattr(run, "history_keys", None)
+    if isinstance(history_keys, str):
+        history_keys = json.loads(history_keys)
+    if not isinstance(history_keys, dict) or not isinstance(history_keys.get("keys", None), dict):
+        return None
+    counts = {}
+    for key, info in history_keys["keys"].items():
+        type_counts = (info.get("typeCounts", None) or []) if isinstance(info, dict) else []
+        if any(t.get("type", None) in NUMERIC_HISTORY_TYPES for t in type_counts):
+            counts[key] = sum(t.get("count", 0) for t in type_counts)
+    return counts
+
+
+def get_scan_keys(run, fields: List[str]) -> Optional[List[str]]:
+    """Returns the keys to request with run.scan_history, which only returns the rows that contain all requested keys.
+    Fields that the run never logged are dropped. If the other fields were not logged in the same number of rows
+    (e.g. at different frequencies) or this is unknown, None is returned and the whole history has to be scanned.
+    Keys starting with '_' (e.g. _step) are contained in every row. An empty list means that the run logged none of the fields."""
+    history_keys = get_history_keys(run)
+    value_fields = [f for f in fields if not f.startswith("_")]
+    logged = [f for f in value_fields if history_keys is None or f in history_keys]
+    if value_fields and not logged:
+        return []
+    if len(logged) > 1 and (history_keys is None or len({history_keys[f] for f in logged}) > 1):
+        return None
+    return logged + [f for f in fields if f.startswith("_")]
+
+
+def discover_fields(run_list: List, field_cache: Dict = None) -> List[str]:
+    """Returns all numeric fields that the runs logged to their history, based on the historyKeys in the run metadata
+    instead of requesting a history sample per run. Runs without historyKeys fall back to the scalar entries of their summary.
+    Fields logged automatically by wandb (starting with '_') and non-scalar fields like media or histograms are excluded,
+    since they can not be exported as arrays.
+    Arguments:
+        run_list {List} -- list of wandb runs
+        field_cache {dict} -- fields discovered per set of runs, e.g. shared by the experiments of one export_data call.
+                              Summaries of running runs change, so it should not outlive a single export.
+    Returns:
+        List[str] -- sorted list of field names
+    """
+    cache_key = tuple(sorted(f"{run.entity}/{run.project}/{run.id}" for run in run_list))
+    if field_cache is not None and cache_key in field_cache:
+        return list(field_cache[cache_key])
+
+    fields = set()
+    for run in run_list:
+        history_keys = get_history_keys(run)
+        if history_keys is not None:
+            fields.update(key for key in history_keys if not key.startswith("_"))
+            continue
+        for key, value in get_summary(run).items():
+            if not key.startswith("_") and isinstance(value, (bool, int, float)):
+                fields.add(key)
+    fields = sorted(fields)
+    if field_cache is not None:
+        field_cache[cache_key] = fields
+    return list(fields)
+
+
+def resolve_fields(fields: Union[str, List[str]], run_list: List, field_cache: Dict = None) -> Union[str, List[str]]:
+    """Resolves 'all' and glob/regex patterns in the fields of an experiment config to a list of field names,
+    which is then requested from the server for all runs of the experiment.
+    Arguments:
+        fields {str or List[str]} -- fields from the experiment config
+        run_list {List} -- list of wandb runs of the experiment
+        field_cache {dict} -- see discover_fields
+    Returns:
+        List[str] or str -- list of field names, or 'all' if no fields could be discovered from the run metadata
+    """
+    if fields == "all" or fields == ["all"]:
+        discovered = discover_fields(run_list, field_cache)
+        return discovered if discovered else "all"
+
+    if not any(is_field_pattern(field) for field in fields):
+        return fields
+
+    discovered = discover_fields(run_list, field_cache)
+    resolved = []
+    for field in fields:
+        if is_field_pattern(field):
+            matches = [f for f in discovered if match_field_pattern(field, f)]
+            if not matches:
+                print(f"Warning: No field matches the pattern {field}")
+            resolved.extend(matches)
+        else:
+            resolved.append(field)
+    # remove duplicates, keeping the order
+    return list(dict.fromkeys(resolved))
@@ -1,4 +1,16 @@
+import json
+
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from wandb2numpy import profiling
+
+
 def get_filtered_runs(config, api):
+    filter_dict = build_run_filters(config)
+    return query_runs(api, config["entity"] + "/" + config["project"], filter_dict, config)
+
+def build_run_filters(config: dict) -> dict:
+    """Builds the MongoDB-style filter dict of the wandb API from the filter parameters of an experiment config"""
     filter_list = []
     filter_dict = {}
     # if "groups" is provided, "runs" and "job_types" are expected to be nested lists
@@ -16,8 +28,8 @@ def get_filtered_runs(config, api):
             filter_dict["display_name"] = {}
             filter_dict["display_name"]["$in"] = config['runs']
         if "job_types" in config.keys():
-            filter_dict["display_name"] = {}
-            filter_dict["display_name"]["$in"] = config['runs']
+            filter_dict["jobType"] = {}
+            filter_dict["jobType"]["$in"] = config['job_types']
         if "tags" in config.keys():
             filter_dict["tags"] = {}
             filter_dict["tags"]["$in"] = config['tags']
@@ -27,11 +39,114 @@ def get_filtered_runs(config, api):
 
     if "summary" in config.keys():
         filter_dict = append_filter_dict("summary_metrics", config["summary"], filter_dict)
-        
-    run_list = list(api.runs(config["entity"] + "/" + config["project"], filters=filter_dict))
-    
+
+    return filter_dict
+
+def query_runs(api, path: str, filter_dict: dict, config: dict) -> List:
+    """Queries the runs matching filter_dict, served from the run list cache if run_list_ttl is set and the entry is fresh"""
+    # imported here, so that building filters (e.g. for --dry-run) does not import numpy and wandb
+    from wandb2numpy.cache import get_run_list_cache
+    from wandb2numpy.fetching import call_with_retry
+
+    cache = get_run_list_cache(config)
+    run_list = cache.load(path, filter_dict, api) if cache is not None else None
+    if run_list is not None:
+        profiling.count("run_list_cache_hits")
+        return run_list
+
+    profiling.count("run_queries")
+    run_list = call_with_retry(lambda: list(api.runs(path, filters=filter_dict, per_page=config.get("runs_per_page", 50))),
+                               config, f"Querying runs of {path}")
+    if cache is not None:
+        cache.save(path, filter_dict, run_list)
     return run_list
 
+def plan_run_queries(config_list: List[dict]) -> Dict[Tuple[str, str], List[int]]:
+    """Groups the experiments that query the same entity/project, so that their runs can be fetched with one query.
+    Experiments with batch_run_queries set to False are not part of the plan."""
+    plan = defaultdict(list)
+    for i, config in enumerate(config_list):
+        if config.get("batch_run_queries", True):
+            plan[(config["entity"], config["project"])].append(i)
+    return dict(plan)
+
+def get_filtered_runs_batched(config_list: List[dict], api) -> List[List]:
+    """Returns the matching runs of every experiment, querying each entity/project only once.
+    The filters of all experiments of a project are merged with $or into a single paginated query,
+    and the resulting runs are assigned to the experiments locally using match_filters.
+    Arguments:
+        config_list {List[dict]} -- experiment configs after merging with DEFAULT
+        api {wandb.Api} -- wandb API
+    Returns:
+        List[List] -- list of runs of each experiment, in the order of config_list
+    """
+    run_lists = [None] * len(config_list)
+    for (entity, project), indices in plan_run_queries(config_list).items():
+        filters = [build_run_filters(config_list[i]) for i in indices]
+        if len(indices) == 1:
+            run_lists[indices[0]] = query_runs(api, f"{entity}/{project}", filters[0], config_list[indices[0]])
+            continue
+
+        # identical filters are queried once, an experiment without any filter needs all runs of the project
+        unique_filters = list({json.dumps(f, sort_keys=True, default=str): f for f in filters}.values())
+        merged = {} if {} in unique_filters else (unique_filters[0] if len(unique_filters) == 1 else {"$or": unique_filters})
+        query_config = dict(config_list[indices[0]])
+        query_config["runs_per_page"] = max(config_list[i].get("runs_per_page", 50) for i in indices)
+        runs = query_runs(api, f"{entity}/{project}", merged, query_config)
+        print(f"Queried {len(runs)} runs of {entity}/{project} for {len(indices)} experiments")
+        for i, filter_dict in zip(indices, filters):
+            run_lists[i] = runs if filter_dict == merged else [run for run in runs if match_filters(run, filter_dict)]
+
+    for i, config in enumerate(config_list):
+        if run_lists[i] is None:
+            run_lists[i] = get_filtered_runs(config, api)
+    return run_lists
+
+def _get_attribute(run, key: str):
+    if key == "group":
+        return run.group
+    if key == "jobType":
+        return run.job_type
+    if key == "display_name":
+        return run.name
+    if key == "tags":
+        return run.tags
+    for prefix, values in (("config.", run.config), ("summary_metrics.", run.summary_metrics)):
+        if key.startswith(prefix):
+            # nested parameters are addressed with dots, e.g. config.optimizer.lr
+            value = values
+            for part in key[len(prefix):].split("."):
+                value = value.get(part) if isinstance(value, dict) else None
+            return value
+    return getattr(run, key, None)
+
+def match_filters(run, filter_dict: dict) -> bool:
+    """Evaluates the filter dicts built by build_run_filters on a run locally, with the semantics of the wandb API"""
+    for key, condition in filter_dict.items():
+        if key == "$or":
+            if not any(match_filters(run, f) for f in condition):
+                return False
+            continue
+        value = _get_attribute(run, key)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for op, operand in condition.items():
+            if op == "$in":
+                if isinstance(value, list):
+                    if not set(value) & set(operand):
+                        return False
+                elif value not in operand:
+                    return False
+            elif op in ("$gte", "$lte"):
+                try:
+                    if value is None or (value < operand if op == "$gte" else value > operand):
+                        return False
+                except TypeError:
+                    return False
+    return True
+
 def build_filter_dict(idx: int, group: str, config: dict) -> dict:
     filter_dict = {}
     filter_dict["group"] = group
@@ -0,0 +1,81 @@
+import numpy as np
+
+from typing import Dict, List
+
+# number of matrix entries that are reduced at once, bounds the memory used for memory mapped matrices
+CHUNK_ELEMENTS = 2 ** 22
+
+
+def get_lod_levels(config: dict) -> List[int]:
+    """Returns the sorted, unique downsampling factors of the lod_levels of an experiment config"""
+    return sorted(set(config.get("lod_levels", None) or []))
+
+
+def _reduce(values: np.ndarray, factor: int, fill: float, ufunc) -> np.ndarray:
+    """Reduces blocks of factor columns with ufunc, padding the last block with fill"""
+    n_blocks = -(-values.shape[1] // factor)
+    padded = np.full((values.shape[0], n_blocks * factor), fill, dtype=values.dtype)
+    padded[:, :values.shape[1]] = values
+    return ufunc.reduce(padded.reshape(values.shape[0], n_blocks, factor), axis=2)
+
+
+def _block_stats(chunk: np.ndarray, factor: int) -> Dict[str, np.ndarray]:
+    valid = ~np.isnan(chunk)
+    return {
+        "min": _reduce(np.where(valid, chunk, np.inf), factor, np.inf, np.minimum),
+        "max": _reduce(np.where(valid, chunk, -np.inf), factor, -np.inf, np.maximum),
+        "sum": _reduce(np.where(valid, chunk, 0.0), factor, 0.0, np.add),
+        "count": _reduce(valid.astype(np.int64), factor, 0, np.add),
+    }
+
+
+def _merge_block_stats(stats: Dict[str, np.ndarray], ratio: int) -> Dict[str, np.ndarray]:
+    """Combines ratio consecutive blocks of a finer level into one block of the next level"""
+    return {
+        "min": _reduce(stats["min"], ratio, np.inf, np.minimum),
+        "max": _reduce(stats["max"], ratio, -np.inf, np.maximum),
+        "sum": _reduce(stats["sum"], ratio, 0.0, np.add),
+        "count": _reduce(stats["count"], ratio, 0, np.add),
+    }
+
+
+def build_lod_levels(matrix: np.ndarray, factors: List[int], chunk_elements: int = CHUNK_ELEMENTS) -> Dict[int, Dict[str, np.ndarray]]:
+    """Builds a pyramid of downsampled levels of a (runs, steps) matrix, e.g. for plotting long runs at a few thousand points.
+    Each level reduces blocks of factor consecutive steps to their minimum, maximum and mean, ignoring NaN padding,
+    so that peaks are preserved. Coarser levels are computed from the finer levels instead of the full data if their factor
+    is a multiple of the finer factor. The matrix is processed in chunks of rows, so memory mapped matrices are never
+    loaded completely.
+    Arguments:
+        matrix {np.ndarray} -- (runs, steps) matrix or a single 1D array
+        factors {List[int]} -- downsampling factors, e.g. [10, 100, 1000]
+        chunk_elements {int} -- approximate number of matrix entries that are reduced at once
+    Returns:
+        dict -- one entry per factor with the (runs, ceil(steps / factor)) arrays min, max and mean
+                (1D for 1D input), NaN for blocks without any value
+    """
+    factors = sorted(set(factors))
+    squeeze = matrix.ndim == 1
+    if squeeze:
+        matrix = matrix.reshape(1, -1)
+    n_rows, n_steps = matrix.shape
+    rows_per_chunk = max(1, chunk_elements // max(n_steps, 1))
+
+    out = {f: {key: np.empty((n_rows, -(-n_steps // f))) for key in ("min", "max", "mean")} for f in factors}
+    for start in range(0, n_rows, rows_per_chunk):
+        chunk = np.asarray(matrix[start:start + rows_per_chunk], dtype=np.float64)
+        finer = {}
+        for factor in factors:
+            base = max((f for f in finer if factor % f == 0), default=None)
+            stats = _merge_block_stats(finer[base], factor // base) if base else _block_stats(chunk, factor)
+            finer[factor] = stats
+
+            empty = stats["count"] == 0
+            rows = slice(start, start + chunk.shape[0])
+            out[factor]["min"][rows] = np.where(empty, np.nan, stats["min"])
+            out[factor]["max"][rows] = np.where(empty, np.nan, stats["max"])
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[factor]["mean"][rows] = np.where(empty, np.nan, stats["sum"] / stats["count"])
+
+    if squeeze:
+        out = {f: {key: values[0] for key, values in level.items()} for f, level in out.items()}
+    return out
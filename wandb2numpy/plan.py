@@ -0,0 +1,101 @@
+import hashlib
+import json
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from wandb2numpy import profiling
+from wandb2numpy.config_loader import check_merged_configs, check_valid_configs, merge_default, merge_dicts, parse_config
+from wandb2numpy.filtering import build_run_filters
+
+# compiled plans by hash of the config and arguments of compile_config, so that repeated calls skip validation
+_compiled_plans = {}
+MAX_COMPILED_PLANS = 128
+
+
+def _canonical_json(value) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+@dataclass(frozen=True)
+class ExportPlan:
+    """Validated, immutable description of the export of one experiment: the merged config, the resulting run filters,
+    the requested fields and the output. Plans are hashable, and key is a hash of the config that other stages can use
+    as cache key. The config is stored as canonical JSON, ExportPlan.config returns a new dictionary on every access."""
+    name: str
+    config_json: str
+    filters_json: str
+    path: str
+    fields: Union[str, Tuple[str, ...]]
+    output_data_type: Optional[str]
+    output_path: Optional[str]
+    key: str
+
+    @classmethod
+    def from_config(cls, name: str, config: Dict) -> "ExportPlan":
+        config_json = _canonical_json(config)
+        fields = config["fields"] if isinstance(config["fields"], str) else tuple(config["fields"])
+        return cls(
+            name=name,
+            config_json=config_json,
+            filters_json=_canonical_json(build_run_filters(config)),
+            path=f"{config['entity']}/{config['project']}",
+            fields=fields,
+            output_data_type=config.get("output_data_type", None),
+            output_path=config.get("output_path", None),
+            key=hashlib.sha256(f"{name}\n{config_json}".encode()).hexdigest(),
+        )
+
+    @property
+    def config(self) -> Dict:
+        return json.loads(self.config_json)
+
+    @property
+    def filters(self) -> Dict:
+        return json.loads(self.filters_json)
+
+    def with_overrides(self, overrides: Dict) -> "ExportPlan":
+        """Returns a plan whose config is updated with overrides, e.g. from the command line"""
+        if not overrides:
+            return self
+        return ExportPlan.from_config(self.name, merge_dicts(self.config, overrides))
+
+
+def check_plans(plans: Sequence[ExportPlan], from_command_line: bool = False) -> bool:
+    """Validates the configs of plans again, e.g. after applying overrides to already compiled plans"""
+    names, config_list = [plan.name for plan in plans], [plan.config for plan in plans]
+    return check_valid_configs(None, config_list, names, from_command_line) and check_merged_configs(config_list, names)
+
+
+def compile_config(config: Dict, experiments_list: List[str] = None, from_command_line: bool = False,
+                   overrides: Dict = None) -> Optional[Tuple[ExportPlan, ...]]:
+    """Validates a config dictionary and compiles one ExportPlan per experiment. All errors of the config are printed at once.
+    The result is memoized, so compiling the same config again (e.g. in repeated export_data calls) skips validation.
+    The config dictionary is not modified.
+    Arguments:
+        config {dict} -- config dictionary, see export_data
+        experiments_list {List[str]} -- experiments to compile. If None, all experiments are compiled.
+        from_command_line {bool} -- If true, output_path is required
+        overrides {dict} -- parameters that overwrite the corresponding entries of every experiment config
+    Returns:
+        Tuple[ExportPlan] -- one plan per experiment in the order of the config, None if the config is invalid
+    """
+    cache_key = hashlib.sha256(_canonical_json([config, experiments_list, from_command_line, overrides]).encode()).hexdigest()
+    if cache_key in _compiled_plans:
+        profiling.count("plan_cache_hits")
+        return _compiled_plans[cache_key]
+
+    default_config, experiment_configs, experiment_names = parse_config(config, experiments_list)
+    if overrides:
+        # overrides take precedence over DEFAULT and the experiments and are validated as part of every experiment
+        experiment_configs = [merge_dicts(c, overrides) for c in experiment_configs]
+    if not check_valid_configs(default_config, experiment_configs, experiment_names, from_command_line):
+        return None
+    config_list = merge_default(default_config, experiment_configs)
+    if not check_merged_configs(config_list, experiment_names):
+        return None
+    plans = tuple(ExportPlan.from_config(name, c) for name, c in zip(experiment_names, config_list))
+
+    if len(_compiled_plans) >= MAX_COMPILED_PLANS:
+        _compiled_plans.pop(next(iter(_compiled_plans)))
+    _compiled_plans[cache_key] = plans
+    return plans
@@ -0,0 +1,123 @@
+import json
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# numpy is imported where it is needed, this module is also used by the lightweight config compilation
+
+# statistics of the export that is currently running, set by collect()
+_active_stats = None
+
+
+class ExportStats:
+    """Performance statistics of an export: time spent per stage, counters (requests, rows, array_bytes, ...)
+    and the latency of each run. All methods are thread-safe. Stage times are summed over all threads,
+    so for concurrent downloads they can be larger than the wall time of the export.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.wall_time = 0.0
+        self.stage_times = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.run_latencies = []
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stage_times[stage] += elapsed
+                self.stage_calls[stage] += 1
+
+    def count(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] += n
+
+    def record_run(self, latency: float, data_dict: Dict[str, "np.ndarray"]):
+        with self.lock:
+            self.run_latencies.append(latency)
+            self.counters["runs"] += 1
+            self.counters["rows"] += max((len(v) for v in data_dict.values()), default=0)
+            # size of the extracted arrays, not of the responses downloaded from wandb
+            self.counters["array_bytes"] += sum(v.nbytes for v in data_dict.values())
+
+    def latency_histogram(self, bins: int = 10) -> Dict[str, List]:
+        import numpy as np
+        if not self.run_latencies:
+            return {"counts": [], "bin_edges": []}
+        counts, bin_edges = np.histogram(self.run_latencies, bins=bins)
+        return {"counts": counts.tolist(), "bin_edges": bin_edges.tolist()}
+
+    def to_dict(self) -> dict:
+        import numpy as np
+        latencies = np.array(self.run_latencies)
+        return {
+            "wall_time": self.wall_time,
+            "stages": {stage: {"time": t, "calls": self.stage_calls[stage]} for stage, t in self.stage_times.items()},
+            "counters": dict(self.counters),
+            "run_latency": {
+                "mean": float(latencies.mean()) if len(latencies) else None,
+                "p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                "p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+                "max": float(latencies.max()) if len(latencies) else None,
+                "histogram": self.latency_histogram(),
+            },
+        }
+
+    def save_json(self, file_path: str):
+        with open(file_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def summary_table(self) -> str:
+        lines = [f"Export profile (wall time {self.wall_time:.2f}s)", f"{'stage':<28}{'time [s]':>12}{'calls':>10}"]
+        for stage, t in sorted(self.stage_times.items(), key=lambda x: -x[1]):
+            lines.append(f"{stage:<28}{t:>12.3f}{self.stage_calls[stage]:>10}")
+        lines.append(f"{'counter':<28}{'value':>12}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<28}{value:>12}")
+        if self.run_latencies:
+            latency = self.to_dict()["run_latency"]
+            lines.append(f"run latency [s]: mean {latency['mean']:.3f}, p50 {latency['p50']:.3f}, "
+                         f"p95 {latency['p95']:.3f}, max {latency['max']:.3f}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def collect():
+    """Makes a new ExportStats object the target of timer() and count() for the duration of the context"""
+    global _active_stats
+    stats = ExportStats()
+    previous, _active_stats = _active_stats, stats
+    try:
+        yield stats
+    finally:
+        stats.wall_time = time.perf_counter() - stats.start
+        _active_stats = previous
+
+
+def active_stats() -> Optional[ExportStats]:
+    return _active_stats
+
+
+@contextmanager
+def timer(stage: str):
+    """Measures the time of a stage if statistics are collected, otherwise does nothing"""
+    if _active_stats is None:
+        yield
+    else:
+        with _active_stats.timer(stage):
+            yield
+
+
+def count(name: str, n: int = 1):
+    if _active_stats is not None:
+        _active_stats.count(name, n)
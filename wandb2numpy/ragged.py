@@ -0,0 +1,153 @@
+import json
+import os
+import numpy as np
+
+from typing import Dict, List
+
+
+class RaggedArray:
+    """Compact storage of runs with different numbers of steps, without padding to the longest run.
+    The values of all runs are concatenated into a flat array, run i covers values[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, values: np.ndarray, offsets: np.ndarray):
+        self.values = values
+        self.offsets = offsets
+
+    @classmethod
+    def from_arrays(cls, arrays: List[np.ndarray], dtype=None) -> "RaggedArray":
+        lengths = np.array([len(a) for a in arrays], dtype=np.int64)
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        values = np.empty(offsets[-1], dtype=dtype if dtype is not None else np.result_type(*arrays))
+        for i, a in enumerate(arrays):
+            values[offsets[i]:offsets[i + 1]] = a
+        return cls(values, offsets)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def shape(self) -> tuple:
+        """Shape of the corresponding padded matrix"""
+        return len(self), int(self.lengths.max()) if len(self) > 0 else 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.offsets.nbytes
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        return self.values[self.offsets[idx]:self.offsets[idx + 1]]
+
+    def to_padded(self, rows=None, max_steps: int = None, fill_value=np.nan) -> np.ndarray:
+        """Returns a padded (runs, steps) matrix, the format that util.run_dict_to_field_dict produces
+        Arguments:
+            rows {List[int]} -- indices of the runs to include, all runs if None
+            max_steps {int} -- number of columns, defaults to the length of the longest included run
+            fill_value -- value used for padding
+        Returns:
+            np.ndarray -- padded matrix, float64 unless the runs have equal length and fill_value is not needed
+        """
+        all_rows = rows is None or np.array_equal(rows, np.arange(len(self)))
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.int64)
+        lengths = self.lengths[rows]
+        if max_steps is None:
+            max_steps = int(lengths.max()) if len(rows) > 0 else 0
+
+        dtype = self.values.dtype if np.all(lengths >= max_steps) else np.result_type(self.values.dtype, np.float64)
+        out = np.full((len(rows), max_steps), fill_value, dtype=dtype)
+        mask = np.arange(max_steps) < np.minimum(lengths, max_steps)[:, None]
+        if all_rows and np.all(lengths <= max_steps):
+            out[mask] = self.values
+        else:
+            out[mask] = np.concatenate([self[i][:max_steps] for i in rows]) if len(rows) > 0 else []
+        return out
+
+
+def choose_dtype(arrays: List[np.ndarray], float_dtype: str = "float32") -> np.dtype:
+    """Chooses the smallest dtype that can hold all runs of a field: bool, the smallest sufficient integer type or float_dtype"""
+    dtype = np.result_type(*arrays)
+    if dtype == bool:
+        return np.dtype(bool)
+    if dtype.kind in "iu":
+        low = min(int(a.min()) for a in arrays if len(a) > 0)
+        high = max(int(a.max()) for a in arrays if len(a) > 0)
+        return np.result_type(np.min_scalar_type(low), np.min_scalar_type(high))
+    return np.dtype(float_dtype)
+
+
+def run_dict_to_ragged_dict(run_dict: dict, config: dict) -> Dict[str, RaggedArray]:
+    """Compact alternative to util.run_dict_to_field_dict: one RaggedArray per field instead of a NaN padded matrix
+    Arguments:
+        run_dict {dict} -- one entry per run, holding a dictionary with one array per field
+        config {dict} -- experiment config, compact_float_dtype sets the dtype of float fields (default float32)
+    Returns:
+        dict -- one RaggedArray per field
+    """
+    n_runs = len(run_dict)
+    output_dict = {}
+    all_fields = set()
+    for x in list(run_dict.keys()):
+        all_fields.update(list(run_dict[x].keys()))
+
+    for field in sorted(all_fields):
+        non_empty_runs = [run_dict[i][field] for i in range(n_runs) if field in run_dict[i].keys() and len(run_dict[i][field]) != 0 and run_dict[i][field].dtype.kind in "biuf"]
+        print(f"Number of runs that include field {field}: {len(non_empty_runs)}")
+        if not non_empty_runs:
+            continue
+
+        ragged = RaggedArray.from_arrays(non_empty_runs, choose_dtype(non_empty_runs, config.get("compact_float_dtype", "float32")))
+        padded_nbytes = np.prod(ragged.shape) * np.dtype(np.float64).itemsize
+        print(f"Compact storage of field {field} ({ragged.values.dtype}): {ragged.nbytes / 1024 ** 2:.2f}MB instead of "
+              f"{padded_nbytes / 1024 ** 2:.2f}MB padded (saving {100 * (1 - ragged.nbytes / max(padded_nbytes, 1)):.0f}%)")
+        output_dict[field] = ragged
+    return output_dict
+
+
+def flatten_ragged_dict(ragged_dict: dict, prefix: tuple = ()) -> Dict[tuple, RaggedArray]:
+    flat = {}
+    for key, value in ragged_dict.items():
+        if isinstance(value, RaggedArray):
+            flat[prefix + (key,)] = value
+        else:
+            flat.update(flatten_ragged_dict(value, prefix + (key,)))
+    return flat
+
+
+def save_ragged(ragged_dict: dict, file_path: str):
+    """Saves a (possibly nested, e.g. by group and job type) dictionary of RaggedArrays to a single .npz file"""
+    flat = flatten_ragged_dict(ragged_dict)
+    arrays = {}
+    for i, ragged in enumerate(flat.values()):
+        arrays[f"values_{i}"] = ragged.values
+        arrays[f"offsets_{i}"] = ragged.offsets
+    keys = json.dumps([list(k) for k in flat.keys()])
+    with open(file_path, "wb") as f:
+        np.savez(f, keys=np.array(keys), **arrays)
+
+    padded_nbytes = sum(np.prod(r.shape) * np.dtype(np.float64).itemsize for r in flat.values())
+    disk_nbytes = os.path.getsize(file_path)
+    print(f"Saved ragged arrays to file {file_path}, {disk_nbytes / 1024 ** 2:.2f}MB on disk instead of "
+          f"{padded_nbytes / 1024 ** 2:.2f}MB for padded float64 arrays")
+
+
+def load_ragged(file_path: str) -> dict:
+    """Loads a file written by save_ragged
+    Arguments:
+        file_path {str} -- path of the .npz file
+    Returns:
+        dict -- one RaggedArray per field, nested by group and job type if the export was grouped
+    """
+    out = {}
+    with np.load(file_path) as npz:
+        keys = json.loads(str(npz["keys"]))
+        for i, key in enumerate(keys):
+            field_dict = out
+            for k in key[:-1]:
+                field_dict = field_dict.setdefault(k, {})
+            field_dict[key[-1]] = RaggedArray(npz[f"values_{i}"], npz[f"offsets_{i}"])
+    return out
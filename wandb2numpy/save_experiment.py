@@ -1,6 +1,9 @@
 import numpy as np
 import os
-import pandas as pd
+
+from wandb2numpy.backends import TABLE_BACKENDS, TABLE_EXTENSIONS
+from wandb2numpy.lod import build_lod_levels, get_lod_levels
+from wandb2numpy.ragged import save_ragged
 
 def create_output_dirs(config: str, experiment: str) -> str:
     output_path = config["output_path"]
@@ -16,7 +19,8 @@ def create_output_dirs(config: str, experiment: str) -> str:
         os.mkdir(experiment_dir)
     return experiment_dir
 
-def save_matrix(matrix_dict, experiment_dir, field, overwrite_flag, config):
+def get_field_path(experiment_dir: str, field: str) -> str:
+    """Returns the path of the output file for a field (without file extension)"""
     # If field name contains "/", create subdirectory to reflect hierarchic field structure
     if "/" in field:
         str_parts = field.split("/")
@@ -29,6 +33,10 @@ def save_matrix(matrix_dict, experiment_dir, field, overwrite_flag, config):
             
     else:
         file_path = os.path.join(experiment_dir, field)
+    return file_path
+
+def save_matrix(matrix_dict, experiment_dir, field, overwrite_flag, config):
+    file_path = get_field_path(experiment_dir, field)
 
     if "output_data_type" in config.keys() and config["output_data_type"] == "csv": # CSV
         if os.path.isfile(file_path + ".csv") and not overwrite_flag:
@@ -47,4 +55,162 @@ def save_matrix(matrix_dict, experiment_dir, field, overwrite_flag, config):
             print("Saved NumPy array to file " + file_path + ".npy, shape of array is " + str(matrix_dict[field].shape))
     
     else:
-        print(f"Error: {config['output_data_type']} is not a valid output format. Possible formats are 'numpy' and 'csv'")
\ No newline at end of file
+        print(f"Error: {config['output_data_type']} is not a valid output format. Possible formats are 'numpy', 'memmap', 'ragged', 'parquet', 'arrow', 'hdf5' and 'csv'")
+
+
+def save_lod_levels(matrix_dict, experiment_dir, field, overwrite_flag, config):
+    """Saves the min/max/mean levels of detail of a field next to its .npy file, one <field>_lod<factor>.npz per factor"""
+    file_path = get_field_path(experiment_dir, field)
+    factors = []
+    for factor in get_lod_levels(config):
+        if os.path.isfile(f"{file_path}_lod{factor}.npz") and not overwrite_flag:
+            print(f"Error: File {file_path}_lod{factor}.npz already exists! To overwrite, rerun script with -o flag.")
+        else:
+            factors.append(factor)
+    if not factors:
+        return
+
+    for factor, level in build_lod_levels(matrix_dict[field], factors).items():
+        with open(f"{file_path}_lod{factor}.npz", 'wb') as f:
+            np.savez(f, **level)
+        print(f"Saved level of detail 1/{factor} to file {file_path}_lod{factor}.npz, shape of arrays is {level['mean'].shape}")
+
+
+def save_ragged_experiment(ragged_dict, experiment_dir, experiment, overwrite_flag):
+    # all fields of an experiment are stored in a single .npz file
+    file_path = os.path.join(experiment_dir, experiment + ".npz")
+    if os.path.isfile(file_path) and not overwrite_flag:
+        print("Error: File " + file_path + " already exists! To overwrite, rerun script with -o flag.")
+    else:
+        save_ragged(ragged_dict, file_path)
+
+
+def save_table(table, experiment_dir, experiment, overwrite_flag, config):
+    # all fields of an experiment are stored as columns of a single file
+    output_data_type = config["output_data_type"]
+    file_path = os.path.join(experiment_dir, experiment + TABLE_EXTENSIONS[output_data_type])
+    if os.path.isfile(file_path) and not overwrite_flag:
+        print("Error: File " + file_path + " already exists! To overwrite, rerun script with -o flag.")
+    else:
+        TABLE_BACKENDS[output_data_type](table, file_path, config)
+        print(f"Saved table to file {file_path}, {len(table.columns)} columns, {len(table)} rows, {os.path.getsize(file_path) / 1024 ** 2:.2f}MB")
+
+
+class MemmapFieldWriter:
+    """Writes the runs of one field directly into the rows of a .npy file opened with np.lib.format.open_memmap,
+    so that the full matrix never has to be held in memory. Rows are padded with NaNs in place.
+    The file is preallocated with an upper bound of the number of steps and compacted in finalize if needed.
+    """
+
+    def __init__(self, file_path: str, n_runs: int, max_steps: int):
+        self.file_path = file_path
+        self.tmp_path = file_path + ".tmp.npy"
+        self.lengths = np.full(n_runs, -1)
+        self.array = np.lib.format.open_memmap(self.tmp_path, mode="w+", dtype=np.float64, shape=(n_runs, max(max_steps, 1)))
+
+    def write_row(self, row: int, values: np.ndarray):
+        steps = len(values)
+        if steps > self.array.shape[1]:
+            self._resize(steps)
+        self.array[row, :steps] = values
+        self.array[row, steps:] = np.nan
+        self.lengths[row] = steps
+
+    def _resize(self, max_steps: int):
+        old_array = self.array
+        resized_path = self.tmp_path + ".resize.npy"
+        self.array = np.lib.format.open_memmap(resized_path, mode="w+", dtype=np.float64, shape=(old_array.shape[0], max_steps))
+        for row in np.flatnonzero(self.lengths >= 0):
+            self.array[row, :old_array.shape[1]] = old_array[row]
+            self.array[row, old_array.shape[1]:] = np.nan
+        del old_array
+        os.replace(resized_path, self.tmp_path)
+
+    def finalize(self) -> np.ndarray:
+        """Drops rows of runs without data for this field, trims the matrix to the longest run
+        and returns a read-only memory map of the final file"""
+        rows = np.flatnonzero(self.lengths > 0)
+        max_steps = int(self.lengths[rows].max()) if len(rows) > 0 else 0
+
+        if len(rows) == self.array.shape[0] and max_steps == self.array.shape[1]:
+            self.array.flush()
+            del self.array
+            os.replace(self.tmp_path, self.file_path)
+        else:
+            out = np.lib.format.open_memmap(self.file_path, mode="w+", dtype=np.float64, shape=(len(rows), max_steps))
+            for k, row in enumerate(rows):
+                out[k] = self.array[row, :max_steps]
+            out.flush()
+            del out
+            del self.array
+            os.remove(self.tmp_path)
+
+        return np.load(self.file_path, mmap_mode="r")
+
+
+class MemmapExperimentWriter:
+    """Creates one MemmapFieldWriter per field (and per group and job type if by_group_and_job_type is set)
+    and writes the data of each run into it as soon as the run has been downloaded.
+    """
+
+    def __init__(self, experiment_dir: str, run_list: list, config: dict, by_group_and_job_type: bool, overwrite_flag: bool):
+        self.experiment_dir = experiment_dir
+        self.overwrite_flag = overwrite_flag
+        self.max_steps = max([estimate_max_steps(run, config) for run in run_list], default=0)
+
+        # position of each run: (group, job_type) or () and row index in the matrices of that position
+        self.positions = []
+        self.n_runs = {}
+        for run in run_list:
+            key = (run.group, run.job_type) if by_group_and_job_type else ()
+            self.positions.append((key, self.n_runs.get(key, 0)))
+            self.n_runs[key] = self.n_runs.get(key, 0) + 1
+        self.writers = {}
+
+    def _get_writer(self, key: tuple, field: str):
+        if (key, field) not in self.writers:
+            writer = None
+            output_dir = os.path.join(self.experiment_dir, *[str(k) for k in key])
+            os.makedirs(output_dir, exist_ok=True)
+            file_path = get_field_path(output_dir, field) + ".npy"
+            if os.path.isfile(file_path) and not self.overwrite_flag:
+                print("Error: File " + file_path + " already exists! To overwrite, rerun script with -o flag.")
+            else:
+                writer = MemmapFieldWriter(file_path, self.n_runs[key], self.max_steps)
+            self.writers[(key, field)] = writer
+        return self.writers[(key, field)]
+
+    def write_run(self, run_idx: int, data_dict: dict):
+        key, row = self.positions[run_idx]
+        for field, values in data_dict.items():
+            # empty and non-numeric fields are not exported, same as in util.run_dict_to_field_dict
+            if len(values) == 0 or values.dtype.kind not in "biuf":
+                continue
+            writer = self._get_writer(key, field)
+            if writer is not None:
+                writer.write_row(row, values)
+
+    def finalize(self) -> dict:
+        """Finalizes all files and returns the same structure as export_data, containing read-only memory maps"""
+        out = {}
+        for (key, field), writer in self.writers.items():
+            if writer is None:
+                continue
+            field_dict = out
+            for k in key:
+                field_dict = field_dict.setdefault(k, {})
+            field_dict[field] = writer.finalize()
+            print(f"Number of runs that include field {field}: {field_dict[field].shape[0]}")
+            print("Saved NumPy memory map to file " + writer.file_path + ", shape of array is " + str(field_dict[field].shape))
+        return out
+
+
+def estimate_max_steps(run, config: dict) -> int:
+    """Upper bound of the number of history rows of a run, based on run metadata and history_samples"""
+    max_samples = 12000
+    last_step = getattr(run, "lastHistoryStep", None)
+    n_steps = last_step + 1 if isinstance(last_step, int) and last_step >= 0 else 0
+    history_samples = config.get("history_samples", max_samples)
+    if history_samples == "all":
+        return n_steps
+    return min(n_steps, history_samples, max_samples)
@@ -0,0 +1,204 @@
+import io
+import json
+import os
+import time
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+from wandb2numpy import profiling, util
+from wandb2numpy.cache import strip_steps
+from wandb2numpy.export import prepare_configs
+from wandb2numpy.fetching import create_api, extract_data_with_retry, get_fetch_settings
+from wandb2numpy.fields import resolve_fields
+from wandb2numpy.filtering import get_filtered_runs_batched
+from wandb2numpy.save_experiment import create_output_dirs, get_field_path
+
+STATE_FILE = ".sync_state.json"
+# output data types that consist of one .npy file per field, which can be updated in place
+SYNCABLE_TYPES = (None, "numpy", "memmap")
+
+
+def _npy_header(dtype: np.dtype, shape: tuple) -> bytes:
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_1_0(buffer, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": True, "shape": shape})
+    return buffer.getvalue()
+
+
+def resize_npy(file_path: str, n_rows: int, n_cols: int):
+    """Grows the (runs, steps) matrix in a .npy file to the given shape, filling new entries with NaN.
+    Matrices are stored in Fortran order, so that new steps are appended to the end of the file and only the header is
+    rewritten. New runs, a header that no longer fits or a file written in C order by save_matrix rewrite the whole file."""
+    if not os.path.isfile(file_path):
+        with util.atomic_write(file_path) as f:
+            np.save(f, np.full((n_rows, n_cols), np.nan, order="F"))
+        return
+
+    with open(file_path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        offset = f.tell()
+    if shape == (n_rows, n_cols):
+        return
+
+    header = _npy_header(dtype, (n_rows, n_cols))
+    if fortran_order and shape[0] == n_rows and n_cols >= shape[1] and len(header) == offset:
+        # write the new columns before the header, so that an interrupted resize leaves a valid file
+        with open(file_path, "r+b") as f:
+            f.seek(offset + n_rows * shape[1] * dtype.itemsize)
+            f.write(np.full(n_rows * (n_cols - shape[1]), np.nan, dtype=dtype).tobytes())
+            f.seek(0)
+            f.write(header)
+        profiling.count("sync_appends")
+        return
+
+    old = np.load(file_path)
+    new = np.full((max(n_rows, shape[0]), max(n_cols, shape[1])), np.nan, order="F")
+    new[:shape[0], :shape[1]] = old
+    with util.atomic_write(file_path) as f:
+        np.save(f, new)
+    profiling.count("sync_rewrites")
+
+
+def load_sync_state(experiment_dir: str) -> dict:
+    state_path = os.path.join(experiment_dir, STATE_FILE)
+    if not os.path.isfile(state_path):
+        return None
+    with open(state_path, "r") as f:
+        return json.load(f)
+
+
+def run_changed(run, run_state: dict) -> bool:
+    """A run needs to be fetched if it is new or if its last history step or update time changed since the last sync"""
+    if run_state is None:
+        return True
+    return (getattr(run, "lastHistoryStep", None) != run_state["history_step"]
+            or getattr(run, "updatedAt", None) != run_state["updated_at"])
+
+
+def sync_experiment(experiment_name: str, config: Dict, run_list: List) -> Dict[str, int]:
+    """Brings the .npy files of an experiment up to date with its runs, fetching only the runs that changed since the
+    last sync and, for full histories, only their new steps. Row i of every field file belongs to the i-th run in the
+    state file, runs are appended in the order they are discovered.
+    Arguments:
+        experiment_name {str} -- name of the experiment
+        config {dict} -- experiment config after merging with DEFAULT
+        run_list {List} -- runs that currently match the filters of the experiment
+    Returns:
+        dict -- number of new runs, updated runs and new history rows
+    """
+    summary = {"new_runs": 0, "updated_runs": 0, "new_rows": 0}
+    if config.get("output_data_type", None) not in SYNCABLE_TYPES:
+        print(f"Error: Sync is only supported for output_data_type 'numpy' and 'memmap', not {config['output_data_type']}. Skipping...")
+        return summary
+
+    experiment_dir = create_output_dirs(config, experiment_name)
+    state = load_sync_state(experiment_dir)
+    if state is None:
+        existing = [os.path.join(root, f) for root, _, files in os.walk(experiment_dir) for f in files if f.endswith(".npy")]
+        if existing and not config.get("overwrite", False):
+            print(f"Error: {experiment_dir} contains files that were not written by sync! To overwrite, rerun script with -o flag.")
+            return summary
+        # the rows of previously exported files do not correspond to the runs of the sync state
+        for file_path in existing:
+            os.remove(file_path)
+        fields = resolve_fields(config["fields"], run_list)
+        state = {"fields": fields, "runs": {}}
+
+    incremental = config.get("history_samples", None) == "all"
+    changed = [run for run in run_list if run_changed(run, state["runs"].get(run.id, None))]
+    for run in changed:
+        if run.id not in state["runs"]:
+            state["runs"][run.id] = {"row": len(state["runs"]), "name": run.name, "last_step": None,
+                                     "history_step": None, "updated_at": None, "n_steps": 0, "lengths": {}}
+            summary["new_runs"] += 1
+        else:
+            summary["updated_runs"] += 1
+
+    def fetch(run):
+        last_step = state["runs"][run.id]["last_step"]
+        min_step = last_step + 1 if incremental and last_step is not None else None
+        return extract_data_with_retry(run, state["fields"], config, min_step=min_step, with_steps=incremental)
+
+    n_workers, _, _ = get_fetch_settings(config)
+    n_rows = len(state["runs"])
+    with ThreadPoolExecutor(max_workers=max(1, min(n_workers, len(changed)))) as executor:
+        futures = {executor.submit(fetch, run): run for run in changed}
+        for future in as_completed(futures):
+            run = futures[future]
+            data_dict = future.result()
+            run_state = state["runs"][run.id]
+            steps = data_dict.get("_step", [])
+            n_new = max((len(v) for v in data_dict.values()), default=0)
+            # full histories are continued after the previous rows of the run, sampled histories replace them
+            start = run_state.get("n_steps", max(run_state["lengths"].values(), default=0)) if incremental else 0
+            with profiling.timer("sync_write"):
+                for field, values in strip_steps(data_dict, state["fields"]).items():
+                    if len(values) == 0:
+                        if not any(field in r["lengths"] for r in state["runs"].values()):
+                            continue
+                        # a field that is missing in all new rows is NaN there, so that all fields stay aligned to the rows
+                        values = np.full(n_new, np.nan)
+                    if values.dtype.kind not in "biuf":
+                        continue
+                    file_path = get_field_path(experiment_dir, field) + ".npy"
+                    n_cols = max([start + len(values)] + [r["lengths"].get(field, 0) for r in state["runs"].values()])
+                    resize_npy(file_path, n_rows, n_cols)
+                    matrix = np.load(file_path, mmap_mode="r+")
+                    if not incremental:
+                        matrix[run_state["row"], :] = np.nan
+                    matrix[run_state["row"], start:start + len(values)] = values
+                    matrix.flush()
+                    del matrix
+                    run_state["lengths"][field] = start + len(values)
+                summary["new_rows"] += n_new
+            run_state["n_steps"] = start + n_new
+            if len(steps) > 0:
+                run_state["last_step"] = int(steps[-1])
+            run_state["history_step"] = getattr(run, "lastHistoryStep", None)
+            run_state["updated_at"] = getattr(run, "updatedAt", None)
+
+    # runs that were added without data still need a row in every file
+    for field in {f for r in state["runs"].values() for f in r["lengths"]}:
+        file_path = get_field_path(experiment_dir, field) + ".npy"
+        resize_npy(file_path, n_rows, max(r["lengths"].get(field, 0) for r in state["runs"].values()))
+
+    # the state is written last, an interrupted sync fetches the same data again next time
+    with util.atomic_write(os.path.join(experiment_dir, STATE_FILE), "w") as f:
+        json.dump(state, f, default=str)
+    print(f"Synced experiment {experiment_name}: {summary['new_runs']} new runs, {summary['updated_runs']} updated runs, "
+          f"{summary['new_rows']} new history rows")
+    return summary
+
+
+def sync_data(config: Dict, experiments_list: List[str] = None, overrides: Dict = None,
+              interval: float = None, max_polls: int = None) -> Dict[str, Dict[str, int]]:
+    """Keeps the .npy outputs of the experiments in the config up to date, e.g. while a sweep is running.
+    The state of each experiment is stored in <output_path>/<experiment>/.sync_state.json, so that a sync only fetches
+    what changed since the previous one, also across invocations.
+    Arguments:
+        config {dict} -- config dictionary, or ExportPlans compiled with compile_config. output_path is required
+        experiments_list {List[str]} -- experiments to sync. If None, all experiments are synced.
+        overrides {dict} -- parameters that overwrite the corresponding entries of every experiment config
+        interval {float} -- if given, sync repeatedly with this many seconds between polls until interrupted
+        max_polls {int} -- maximum number of polls if interval is given, unlimited if None
+    Returns:
+        dict -- summary of the last poll for each experiment
+    """
+    experiment_names, config_list = prepare_configs(config, experiments_list, from_command_line=True, overrides=overrides)
+    api = create_api(config_list)
+
+    n_polls = 0
+    while True:
+        start = time.perf_counter()
+        with profiling.timer("get_filtered_runs"):
+            run_lists = get_filtered_runs_batched(config_list, api)
+        summaries = {name: sync_experiment(name, c, run_list) for name, c, run_list in zip(experiment_names, config_list, run_lists)}
+        n_polls += 1
+        if interval is None or (max_polls is not None and n_polls >= max_polls):
+            return summaries
+        try:
+            time.sleep(max(0.0, interval - (time.perf_counter() - start)))
+        except KeyboardInterrupt:
+            return summaries
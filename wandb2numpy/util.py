@@ -1,7 +1,14 @@
 import numpy as np
-import pandas as pd
+import os
+import sys
+import tempfile
 from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+from operator import itemgetter
 from tqdm import tqdm
+from wandb2numpy import profiling
+from wandb2numpy.fields import get_scan_keys
 
 try:
     from collections.abc import Mapping
@@ -20,11 +27,13 @@ def default_to_regular(d):
     return d
 
 
-def extract_data(run, fields, config):
+def extract_data(run, fields, config, min_step=None, with_steps=False):
     max_samples = 12000
+    page_size = config.get('history_page_size', 1000)
     
     if fields == "all" or fields == ["all"]:
         # get history with only 1 sample, to extract all available field names
+        profiling.count("history_requests")
         dummy_history_all_fields = run.history(samples = 1, pandas=False)
         if list(dummy_history_all_fields): # check that history is not empty
             all_fields_list = list(dummy_history_all_fields[0].keys())
@@ -37,10 +46,28 @@ def extract_data(run, fields, config):
             tqdm.write("Warning: Current run contains no fields at all.")
         
         fields = all_fields_list
+        x_key = (config.get('align', None) or {}).get('x_key', "_step")
+        if config.get('align', None) and x_key not in fields:
+            # the x values are needed to align the runs
+            fields.append(x_key)
+
+    if with_steps and "_step" not in fields:
+        # keep the step of each data point, e.g. to continue downloading from the last cached step later
+        fields = list(fields) + ["_step"]
 
     if 'history_samples' in config.keys():
         if config['history_samples'] == "all":
-            history = run.scan_history()
+            # only request the needed keys and page through the history once. scan_history only returns the rows
+            # that contain all requested keys, so fields that are not logged together are scanned without keys
+            scan_keys = get_scan_keys(run, fields)
+            if scan_keys == []:
+                history = []
+            else:
+                history = run.scan_history(keys=scan_keys, page_size=page_size, min_step=min_step or 0)
+                profiling.count("history_scans")
+                if scan_keys is None:
+                    value_fields = [f for f in fields if not f.startswith("_")]
+                    history = (row for row in history if any(f in row for f in value_fields))
         else:
             if not isinstance(config['history_samples'], int):
                 tqdm.write(f"Error: history_samples must be 'all' or of type Integer")
@@ -48,24 +75,164 @@ def extract_data(run, fields, config):
             else:
                 n_samples = min(config['history_samples'], max_samples)
                 history = run.history(keys=fields, samples=n_samples, pandas=False)
+                profiling.count("history_requests")
     else:
         history = run.history(keys=fields, samples=max_samples, pandas=False)
+        profiling.count("history_requests")
+
+    return history_to_arrays(history, fields, run.name, chunk_size=page_size, spill_dir=config.get('spill_dir', None))
+
+
+def history_to_arrays(history, fields, run_name: str = "", chunk_size: int = 1000, spill_dir: str = None) -> dict:
+    """Converts a run history (iterable of dicts, one per step) into one NumPy array per field in a single pass.
+    The history is consumed in chunks, and all fields of a chunk are written into a float64 ColumnStore at once,
+    so peak memory is proportional to chunk_size if the columns are spilled to disk.
+    Steps that miss a field are filled with NaN, fields that are missing in every step result in an empty array.
+    Fields that only contain bools or integers are cast to the corresponding dtype if no step is missing,
+    fields with non-numeric values (e.g. strings or media) fall back to np.array of the raw values.
+    Arguments:
+        history {Iterable[dict]} -- run history, e.g. from run.history(pandas=False) or run.scan_history()
+        fields {List[str]} -- fields to be extracted
+        run_name {str} -- name of the run, used for warnings
+        chunk_size {int} -- number of steps that are converted at once
+        spill_dir {str} -- if given, columns are written to files in this directory and returned as memory maps
+    Returns:
+        dict -- one array per field
+    """
+    capacity = len(history) if isinstance(history, list) else chunk_size
+    store = ColumnStore(fields, capacity, spill_dir)
+    raw_values = {}  # fields with non-numeric values
+    kinds = {}
 
+    history_iter = iter(history)
+    while True:
+        chunk = list(islice(history_iter, chunk_size))
+        if not chunk:
+            break
+        profiling.count("history_pages")
+
+        with profiling.timer("convert_history"):
+            for key in fields:
+                if key not in kinds:
+                    kinds[key] = next((type(row[key]) for row in chunk if key in row), None)
+
+            if store.fields:
+                rows = chunk_to_rows(chunk, store.fields)
+                try:
+                    block = np.array(rows, dtype=np.float64)
+                except (TypeError, ValueError):
+                    # move fields with non-numeric values out of the float columns
+                    keep = []
+                    for j, key in enumerate(list(store.fields)):
+                        try:
+                            np.array([row[j] for row in rows], dtype=np.float64)
+                            keep.append(j)
+                        except (TypeError, ValueError):
+                            raw_values[key] = list(store.remove(key))
+                    block = np.array([[row[j] for j in keep] for row in rows], dtype=np.float64).reshape(len(chunk), len(keep))
+                store.append(block)
+            else:
+                store.n_rows += len(chunk)
+
+            for key, values in raw_values.items():
+                values.extend(row.get(key, np.nan) for row in chunk)
+
+    n_rows = store.n_rows
+    columns = store.finalize()
     data_dict = {}
     for key in fields:
-        data_list = []
-        is_valid_key = True
-        for data_point in history:
-            if not key in data_point.keys():
-                tqdm.write(f"Warning: Run {run.name} does not have a field called {key}")
-                is_valid_key = False
-                break
-            if is_valid_key:
-                data_list.append(data_point[key])
-        data_dict[key] = np.array(data_list)
+        if key in raw_values:
+            data_dict[key] = np.array(raw_values[key])
+            continue
+
+        array = columns[key]
+        n_missing = np.count_nonzero(np.isnan(array))
+        if n_rows > 0 and n_missing == n_rows:
+            tqdm.write(f"Warning: Run {run_name} does not have a field called {key}")
+            array = np.array([])
+        elif n_missing > 0:
+            tqdm.write(f"Warning: Run {run_name} misses field {key} in {n_missing} of {n_rows} steps, filled with NaN")
+        elif kinds.get(key) is bool and np.all((array == 0) | (array == 1)):
+            array = array.astype(bool)
+        elif kinds.get(key) is int and np.all(np.floor(array) == array):
+            array = array.astype(np.int64)
+        data_dict[key] = array
     return data_dict
 
 
+class ColumnStore:
+    """Growable float64 storage for the fields of a history. Chunks of rows are either appended to a 2D buffer
+    in memory (one contiguous row per field), which doubles its capacity when full, or spilled to one file per field in spill_dir.
+    """
+
+    def __init__(self, fields, capacity: int, spill_dir: str = None):
+        self.fields = list(fields)
+        self.n_rows = 0
+        self.spill_dir = spill_dir
+        if spill_dir is None:
+            self.buffer = np.empty((len(self.fields), max(capacity, 1)))
+        else:
+            os.makedirs(spill_dir, exist_ok=True)
+            self.files = {}
+            for key in self.fields:
+                fd, path = tempfile.mkstemp(dir=spill_dir, suffix=".f64")
+                self.files[key] = (os.fdopen(fd, "wb"), path)
+
+    def append(self, block: np.ndarray):
+        n = block.shape[0]
+        if self.spill_dir is None:
+            if self.n_rows + n > self.buffer.shape[1]:
+                new_buffer = np.empty((len(self.fields), max(2 * self.buffer.shape[1], self.n_rows + n)))
+                new_buffer[:, :self.n_rows] = self.buffer[:, :self.n_rows]
+                self.buffer = new_buffer
+            self.buffer[:, self.n_rows:self.n_rows + n] = block.T
+        else:
+            for j, key in enumerate(self.fields):
+                self.files[key][0].write(np.ascontiguousarray(block[:, j]).tobytes())
+        self.n_rows += n
+
+    def remove(self, key: str) -> np.ndarray:
+        """Removes a field from the store and returns its values so far"""
+        j = self.fields.index(key)
+        self.fields.pop(j)
+        if self.spill_dir is None:
+            values = self.buffer[j, :self.n_rows].copy()
+            self.buffer = np.delete(self.buffer, j, axis=0)
+            return values
+        f, path = self.files.pop(key)
+        f.close()
+        values = np.fromfile(path, dtype=np.float64)
+        os.remove(path)
+        return values
+
+    def finalize(self) -> dict:
+        """Returns one contiguous array per field. Spilled fields are returned as read-only memory maps."""
+        if self.spill_dir is None:
+            if self.buffer.shape[1] == self.n_rows:
+                return {key: self.buffer[j] for j, key in enumerate(self.fields)}
+            return {key: self.buffer[j, :self.n_rows].copy() for j, key in enumerate(self.fields)}
+
+        columns = {}
+        for key, (f, path) in self.files.items():
+            f.close()
+            columns[key] = np.memmap(path, dtype=np.float64, mode="r") if self.n_rows > 0 else np.array([])
+            try:
+                # the memory map keeps the data accessible on POSIX systems
+                os.remove(path)
+            except OSError:
+                pass
+        return columns
+
+
+def chunk_to_rows(chunk: list, fields: list) -> list:
+    """Returns one tuple of values per step, missing values are replaced by NaN"""
+    getter = itemgetter(*fields) if len(fields) > 1 else lambda row: (row[fields[0]],)
+    try:
+        return [getter(row) for row in chunk]
+    except KeyError:
+        return [tuple(row.get(key, np.nan) for key in fields) for row in chunk]
+
+
 def run_dict_to_field_dict(run_dict, config):
     n_runs = len(run_dict)
     output_dict = {}
@@ -74,7 +241,8 @@ def run_dict_to_field_dict(run_dict, config):
         all_fields.update(list(run_dict[x].keys()))
 
     for field in all_fields:
-        non_empty_runs = [run_dict[i][field] for i in range(n_runs) if field in run_dict[i].keys() and len(run_dict[i][field]) != 0 and not isinstance(run_dict[i][field][0], dict)]
+        # non-numeric fields (e.g. media or dicts) can not be stored in a float matrix, the same check as for the other output types
+        non_empty_runs = [run_dict[i][field] for i in range(n_runs) if field in run_dict[i].keys() and len(run_dict[i][field]) != 0 and run_dict[i][field].dtype.kind in "biuf"]
         n_non_empty_runs = len(non_empty_runs)
         if n_non_empty_runs > 0:
             max_steps = max([len(run) for run in non_empty_runs])
@@ -92,6 +260,7 @@ def run_dict_to_field_dict(run_dict, config):
         if "output_data_type" in config.keys() and config["output_data_type"] == "csv":
             row_names = [f"run {i}" for i in range(0, output_array.shape[0])]
             column_names = [f"step {i}" for i in range(0, output_array.shape[1])]
+            import pandas as pd
             df = pd.DataFrame(output_array, index = row_names, columns = column_names)
             output_dict[field] = df
         else:
@@ -124,6 +293,37 @@ def deep_update(base_dict: dict, update_dict: dict) -> dict:
     return base_dict
 
 
+def peak_rss_mb() -> float:
+    """Returns the peak resident set size of the current process in MB, or NaN if it is not available"""
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+@contextmanager
+def atomic_write(file_path: str, mode: str = "wb"):
+    """Opens a temporary file next to file_path and moves it to file_path once writing succeeded,
+    so that readers never see a partially written file.
+    Arguments:
+        file_path {str} -- final path of the file
+        mode {str} -- mode used to open the temporary file
+    """
+    directory, name = os.path.split(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
 def filter_match(config, filter_param, run_param):
     if not filter_param in config.keys():
         return True